@@ -0,0 +1,67 @@
+"""
+Compares the old bare requests.post transport with the pooled session and the
+async transport against a local fake completions server.
+
+    python bench_gpt_transport.py --requests 500 --latency 0.02 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from training_test.views.question import gpt_transport
+from fake_openai import FakeCompletionsServer
+
+PAYLOAD = {
+    'model': 'gpt-4o-mini',
+    'messages': [{'role': 'user', 'content': 'benchmark'}],
+    'function_call': {'name': 'evaluate_answer'},
+}
+
+
+def bare_post(_):
+    response = requests.post(gpt_transport.CHAT_COMPLETIONS_URL, headers=gpt_transport.get_headers(), json=PAYLOAD)
+    response.raise_for_status()
+    return response.json()
+
+
+def pooled_post(_):
+    return gpt_transport.post_chat_completion(PAYLOAD)
+
+
+def run_threaded(fn, total, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fn, range(total)))
+    return time.perf_counter() - started
+
+
+async def run_async(total):
+    started = time.perf_counter()
+    await asyncio.gather(*(gpt_transport.apost_chat_completion(PAYLOAD) for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    await gpt_transport.aclose()
+    return elapsed
+
+
+def report(name, total, elapsed):
+    print(f'{name:<22} {total} requests in {elapsed:.2f}s  ->  {total / elapsed:.1f} req/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    with FakeCompletionsServer(latency=args.latency) as server:
+        gpt_transport.CHAT_COMPLETIONS_URL = f'{server.url}/v1/chat/completions'
+
+        report('requests.post', args.requests, run_threaded(bare_post, args.requests, args.concurrency))
+        report('pooled session', args.requests, run_threaded(pooled_post, args.requests, args.concurrency))
+        report('async (httpx)', args.requests, asyncio.run(run_async(args.requests)))
+
+
+if __name__ == '__main__':
+    main()
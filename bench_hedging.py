@@ -0,0 +1,73 @@
+"""
+Tail latency of post_chat_completion with and without hedging against a stub server
+that injects slow responses and 503s, plus a model fallback check.
+
+    python bench_hedging.py --requests 400 --slow-rate 0.03 --slow-latency 1.0 --error-rate 0.01
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from training_test.views.question import gpt_transport
+from fake_openai import FakeCompletionsServer
+
+PAYLOAD = {
+    'model': 'gpt-4o-mini',
+    'messages': [{'role': 'user', 'content': 'benchmark'}],
+    'function_call': {'name': 'evaluate_answer'},
+}
+
+
+def timed_post(_):
+    started = time.perf_counter()
+    try:
+        gpt_transport.post_chat_completion(PAYLOAD)
+        ok = True
+    except Exception:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run(name, total, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_post, range(total)))
+    latencies = [latency for latency, _ in results]
+    failed = sum(1 for _, ok in results if not ok)
+    print(f'{name:<12} p50={percentile(latencies, 0.5) * 1000:7.1f}ms  p99={percentile(latencies, 0.99) * 1000:7.1f}ms  '
+          f'max={max(latencies) * 1000:7.1f}ms  failed={failed}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02)
+    # Slow responses must stay below the hedge percentile (p95), or the hedge delay lands in the slow tail
+    parser.add_argument('--slow-rate', type=float, default=0.03)
+    parser.add_argument('--slow-latency', type=float, default=1.0)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    gpt_transport.OPEN_AI_RETRY_BASE_DELAY = 0.05
+    with FakeCompletionsServer(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                               error_rate=args.error_rate, failing_models={'gpt-4o'}) as server:
+        gpt_transport.CHAT_COMPLETIONS_URL = f'{server.url}/v1/chat/completions'
+
+        gpt_transport.OPEN_AI_HEDGE_ENABLED = False
+        run('no hedging', args.requests, args.concurrency)
+
+        gpt_transport.OPEN_AI_HEDGE_ENABLED = True
+        gpt_transport.latency_tracker = gpt_transport.LatencyTracker()
+        run('hedged', args.requests, args.concurrency)
+        print(f'hedge delay after warm-up: {gpt_transport.get_hedge_delay() * 1000:.1f}ms')
+
+        response_data = gpt_transport.post_chat_completion({**PAYLOAD, 'model': 'gpt-4o'})
+        print(f'gpt-4o always failing -> answered by {response_data["model"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Per-grade prompt construction cost of get_function_and_messages.
+
+"baseline" is gpt_messages_dict.py as of --baseline-rev (loaded with git show; skipped
+outside a checkout), which rebuilt all three languages on every call; "cold" clears the
+template caches before every call and "warm" is the steady state.
+
+    python bench_prompt_templates.py --iterations 20000
+"""
+import argparse
+import subprocess
+import timeit
+import types
+import gpt_messages_dict
+
+ARGS = (
+    'Қазақ тілі',
+    'Зат есім',
+    'Зат есімнің түрлерін ажырата алу',
+    {'text': 'Зат есім дегеніміз не? Мысал келтіріңіз.', 'payload': {'criteria': 'Анықтама 5, Мысал 5'}},
+    'Зат есім заттың атын білдіреді, мысалы: кітап, үй.',
+    'Анықтама 5, Мысал 5',
+)
+
+
+def load_baseline(rev):
+    try:
+        source = subprocess.run(
+            ['git', 'show', f'{rev}:gpt_messages_dict.py'], capture_output=True, text=True, check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f'baseline skipped: {getattr(e, "stderr", None) or e}'.strip())
+        return None
+    module = types.ModuleType('gpt_messages_dict_baseline')
+    exec(compile(source, f'{rev}:gpt_messages_dict.py', 'exec'), module.__dict__)
+    return lambda: module.get_function_and_messages(*ARGS)
+
+
+def cold():
+    gpt_messages_dict.detect_language.cache_clear()
+    gpt_messages_dict.get_function_schema.cache_clear()
+    return gpt_messages_dict.get_function_and_messages(*ARGS)
+
+
+def warm():
+    return gpt_messages_dict.get_function_and_messages(*ARGS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--baseline-rev', default='7b47712', help='revision before the template caches')
+    args = parser.parse_args()
+
+    variants = [('baseline', load_baseline(args.baseline_rev)), ('cold', cold), ('warm', warm)]
+    for name, fn in variants:
+        if fn is None:
+            continue
+        elapsed = min(timeit.repeat(fn, number=args.iterations, repeat=3))
+        print(f'{name:<8} {elapsed / args.iterations * 1e6:8.2f} us/call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Query plans and timings of the main resume/vacancy access paths on SQLite, with the indexes from
+resume_schema_migration dropped and then created.
+
+    python bench_resume_queries.py --vacancies 50 --resumes 20000 --iterations 200
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import create_engine, insert, text
+from config.shared_base import Base
+from model2 import Vacancy
+from resume_importer import import_resumes
+from resume_schema_migration import downgrade, upgrade
+
+CHILD_TABLES = ('education', 'experience', 'skills', 'contacts', 'languages', 'citizenship', 'certificates', 'scan_results')
+
+QUERIES = {
+    'resumes for vacancy': ['SELECT * FROM resumes WHERE vacancy_id = :vacancy_id'],
+    'full resume profile': ['SELECT * FROM resumes WHERE resume_id = :resume_id'] + [
+        f'SELECT * FROM {table} WHERE resume_id = :resume_id' for table in CHILD_TABLES
+    ],
+    'scan results for vacancy': ['SELECT * FROM scan_results WHERE vacancy_id = :vacancy_id'],
+}
+
+
+def make_resume(index, vacancy_ids):
+    resume_id = f'r{index}'
+    vacancy_id = random.choice(vacancy_ids)
+
+    def children(prefix, count, **fields):
+        return [{f'{prefix}_id': f'{resume_id}-{prefix}{n}', **fields} for n in range(count)]
+
+    return {
+        'resume_id': resume_id,
+        'last_name': 'Иванов',
+        'first_name': 'Иван',
+        'title': 'Python developer',
+        'vacancy_id': vacancy_id,
+        'response_date': '2024-03-01',
+        'education': children('education', 2, level='higher', organization='КазНУ', year=2015),
+        'experience': children('experience', 3, company='ТОО Пример', position='Developer', description='Django, SQL'),
+        'skills': children('skill', 5, skill_name='Python'),
+        'contacts': children('contact', 2, contact_type='email', contact_info='ivan@example.com'),
+        'languages': children('language', 1, language_name='Русский'),
+        'citizenship': children('citizenship', 1, country_name='Казахстан'),
+        'certificates': children('certificate', 1, certificate_title='AWS'),
+        'scan_results': [{'vacancy_id': vacancy_id, 'candidate_data': {'score': random.random()}}],
+    }
+
+
+def populate(engine, vacancies, resumes):
+    vacancy_ids = [f'v{index}' for index in range(vacancies)]
+    with engine.begin() as connection:
+        connection.execute(insert(Vacancy.__table__), [
+            {'vacancy_id': vacancy_id, 'description': 'Python developer', 'responses': 0, 'active': True}
+            for vacancy_id in vacancy_ids
+        ])
+    import_resumes(engine, (make_resume(index, vacancy_ids) for index in range(resumes)))
+    return vacancy_ids
+
+
+def query_plan(connection, sql, params):
+    return [row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params)]
+
+
+def measure(engine, vacancy_ids, resumes, iterations):
+    with engine.connect() as connection:
+        for name, statements in QUERIES.items():
+            sample = {'vacancy_id': vacancy_ids[0], 'resume_id': 'r0'}
+            print(f'  {name}')
+            for sql in statements:
+                print(f'    {sql}\n      ' + '\n      '.join(query_plan(connection, sql, sample)))
+
+            started = time.perf_counter()
+            for _ in range(iterations):
+                params = {'vacancy_id': random.choice(vacancy_ids), 'resume_id': f'r{random.randrange(resumes)}'}
+                for sql in statements:
+                    connection.execute(text(sql), params).fetchall()
+            print(f'    {(time.perf_counter() - started) / iterations * 1000:.3f} ms per call')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vacancies', type=int, default=50)
+    parser.add_argument('--resumes', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f'sqlite:///{os.path.join(directory, "bench.db")}')
+        Base.metadata.create_all(engine)
+        vacancy_ids = populate(engine, args.vacancies, args.resumes)
+
+        downgrade(engine)
+        print('without indexes')
+        measure(engine, vacancy_ids, args.resumes, args.iterations)
+
+        upgrade(engine)
+        print('with indexes')
+        measure(engine, vacancy_ids, args.resumes, args.iterations)
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from schoolproj import settings
+from training_test.models import QuestionClone
+from training_test.tasks.generate_clones import task_generate_gpt_extra_questions
+from training_test.views.question.grading_metrics import start_trace
+from training_test.views.test.single_flight import enqueue_once, incr_counter
+
+# Unused clones kept ready per question, and the level below which more are generated in the background
+CLONE_POOL_SIZE = getattr(settings, 'CLONE_POOL_SIZE', 5)
+CLONE_POOL_LOW_WATERMARK = getattr(settings, 'CLONE_POOL_LOW_WATERMARK', 2)
+# A stale answer only costs a suppressed enqueue or one skipped warm-up, so the flag is not invalidated
+TEST_HAS_CLONES_TTL = getattr(settings, 'TEST_HAS_CLONES_TTL', 60 * 5)
+
+CLONE_POOL_COUNTERS = ('clone_pool_hits', 'clone_pool_misses', 'clone_pool_replenishments')
+
+
+def get_clone_pool_stats() -> dict:
+    counters = cache.get_many(list(CLONE_POOL_COUNTERS))
+    return {key: counters.get(key, 0) for key in CLONE_POOL_COUNTERS}
+
+
+def test_has_clones(test_id : int, level) -> bool:
+    key = f'test_{test_id}_level_{level.id}_has_clones'
+    has_clones = cache.get(key)
+    if has_clones is None:
+        has_clones = QuestionClone.objects.filter(question__test_id=test_id, question__test_levels=level).exists()
+        cache.set(key, has_clones, timeout=TEST_HAS_CLONES_TTL)
+    return has_clones
+
+
+def replenish_clone_pool(question_id : int, available : int):
+    if available < CLONE_POOL_LOW_WATERMARK:
+        # Keyed by question only: one refill in flight is enough whatever count it was asked for
+        if enqueue_once(task_generate_gpt_extra_questions, question_id, CLONE_POOL_SIZE - available):
+            incr_counter('clone_pool_replenishments')
+
+
+def take_clone(question_id : int, used_clone_ids=()) -> QuestionClone | None:
+    """
+    Random clone of the question the student has not seen yet, picked in one query.
+    Tops the pool up in the background when fewer than CLONE_POOL_LOW_WATERMARK unused clones are
+    left after this one. Returns None on an empty pool; the caller then generates synchronously.
+    """
+    clones = list(
+        QuestionClone.objects.select_related('payload').filter(question_id=question_id).exclude(id__in=used_clone_ids)
+        .order_by('?')[:CLONE_POOL_SIZE]
+    )
+    available = max(len(clones) - 1, 0)
+    replenish_clone_pool(question_id, available)
+
+    trace = start_trace('clone_pool', bind=False)
+    trace.set(question_id=question_id, available=available)
+    if not clones:
+        incr_counter('clone_pool_misses')
+        trace.finish('miss')
+        return None
+
+    incr_counter('clone_pool_hits')
+    trace.finish('hit')
+    return clones[0]
@@ -0,0 +1,55 @@
+import time
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.response import Response
+from training_test.models import TopicTrainingStat
+
+
+def topic_stats_version_key(student_id : int) -> str:
+    return f'student_{student_id}_topic_stats_version'
+
+
+def _initial_version() -> int:
+    # A counter lost to eviction must not restart at a value a client may still hold
+    return int(time.time() * 1000)
+
+
+def get_topic_stats_version(student_id : int) -> int:
+    key = topic_stats_version_key(student_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def make_etag(*parts) -> str:
+    return '"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match : str | None, etag : str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    # Weak comparison is what If-None-Match asks for, so W/ prefixes are ignored
+    return '*' in candidates or etag in (candidate.removeprefix('W/') for candidate in candidates)
+
+
+def not_modified(etag : str) -> Response:
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+def with_etag(response : Response, etag : str) -> Response:
+    response['ETag'] = etag
+    return response
+
+
+@receiver([post_save, post_delete], sender=TopicTrainingStat)
+def bump_topic_stats_version(sender, instance, **kwargs):
+    key = topic_stats_version_key(instance.student_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
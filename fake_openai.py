@@ -0,0 +1,269 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, for benchmarks and load tests.
+
+    python fake_openai.py --port 8089 --latency lognormal:-1.2,0.5 --error-rate 0.01
+
+Point the grading path at it with settings.OPEN_AI_BASE_URL = 'http://127.0.0.1:8089'.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_EVALUATION = (
+    "### Ответ оценен на 7.5 из 10 баллов\n\n"
+    "- **Критерий 1 (Полнота ответа, 5)**: **4/5**. Основные аспекты раскрыты.\n"
+    "- **Критерий 2 (Точность, 5)**: **3.5/5**. Есть неточности в терминах."
+)
+
+
+def make_latency_sampler(spec):
+    """
+    Latency in seconds from a number or a spec string:
+      'fixed:0.3', 'uniform:0.1,0.8', 'normal:0.5,0.1', 'lognormal:-1.2,0.5', 'exponential:0.4'
+    """
+    if callable(spec):
+        return spec
+    if isinstance(spec, str) and ':' not in spec:
+        spec = float(spec)
+    if isinstance(spec, (int, float)):
+        return lambda: spec
+
+    kind, _, raw_params = spec.partition(':')
+    params = [float(param) for param in raw_params.split(',') if param]
+    if kind == 'fixed':
+        return lambda: params[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(params[0], params[1])
+    if kind == 'normal':
+        return lambda: max(random.gauss(params[0], params[1]), 0.0)
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(params[0], params[1])
+    if kind == 'exponential':
+        return lambda: random.expovariate(1 / params[0])
+    raise ValueError(f'Unknown latency distribution: {spec}')
+
+
+def fake_value(schema):
+    """Smallest valid value for a JSON schema fragment, used for functions other than evaluate_answer."""
+    schema_type = schema.get('type')
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if schema_type == 'object':
+        properties = schema.get('properties', {})
+        return {name: fake_value(properties[name]) for name in schema.get('required', properties)}
+    if schema_type == 'array':
+        return [fake_value(schema.get('items', {'type': 'string'})) for _ in range(max(schema.get('minItems', 1), 1))]
+    if schema_type == 'number':
+        return 1.0
+    if schema_type == 'integer':
+        return 1
+    if schema_type == 'boolean':
+        return False
+    return 'fake'
+
+
+def make_arguments(request_data):
+    function_name = (request_data.get('function_call') or {}).get('name', 'evaluate_answer')
+    if function_name == 'evaluate_answer':
+        return function_name, {'points': 7.5, 'criteria_evaluation': FAKE_EVALUATION, 'moderation_flag': False}
+
+    for function in request_data.get('functions', []):
+        if function['name'] == function_name:
+            return function_name, fake_value(function.get('parameters', {}))
+    return function_name, {}
+
+
+def estimate_tokens(text):
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+def make_completion(arguments: dict, model: str = 'gpt-4o-mini', function_name='evaluate_answer', prompt_tokens=0) -> dict:
+    encoded = json.dumps(arguments, ensure_ascii=False)
+    completion_tokens = estimate_tokens(encoded)
+    return {
+        'id': 'chatcmpl-fake',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {
+                'role': 'assistant',
+                'content': None,
+                'function_call': {'name': function_name, 'arguments': encoded},
+            },
+            'finish_reason': 'function_call',
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class _CompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, every keep-alive response
+    # waits out the client's delayed ACK (~40 ms) and the pooled session looks slower than bare posts
+    disable_nagle_algorithm = True
+
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request_data = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        model = request_data.get('model', 'gpt-4o-mini')
+        with server.lock:
+            server.requests_count += 1
+
+        latency = server.slow_latency if random.random() < server.slow_rate else server.sample_latency()
+        if latency:
+            time.sleep(latency)
+
+        if model in server.failing_models or random.random() < server.error_rate:
+            with server.lock:
+                server.errors_count += 1
+            self._send_json(server.error_status, {'error': {'message': 'injected error', 'type': 'server_error'}})
+            return
+
+        function_name, arguments = make_arguments(request_data)
+        if request_data.get('stream'):
+            self._send_stream(arguments, model, function_name)
+        else:
+            prompt_tokens = estimate_tokens(json.dumps(request_data.get('messages', []), ensure_ascii=False))
+            self._send_json(200, make_completion(arguments, model, function_name, prompt_tokens))
+
+    def _send_stream(self, arguments, model, function_name):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        encoded = json.dumps(arguments, ensure_ascii=False)
+        size = self.server.stream_chunk_size
+        for start in range(0, len(encoded), size):
+            function_call = {'arguments': encoded[start:start + size]}
+            if start == 0:
+                function_call['name'] = function_name
+            chunk = {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'function_call': function_call}}],
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+            if self.server.stream_chunk_delay:
+                time.sleep(self.server.stream_chunk_delay)
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+    def _send_json(self, status_code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _CompletionsHTTPServer(ThreadingHTTPServer):
+    # The default backlog of 5 resets connections as soon as a benchmark opens more at once
+    request_queue_size = 1024
+
+
+class FakeCompletionsServer:
+    """
+    `latency` is a number or a distribution spec (see make_latency_sampler). On top of it
+    `slow_rate` of the requests take `slow_latency`, `error_rate` of them answer with
+    `error_status`, and models listed in `failing_models` always fail.
+    Requests with "stream": true get the arguments as SSE chunks of `stream_chunk_size` characters.
+
+    Usage:
+        with FakeCompletionsServer(latency='lognormal:-1.2,0.5', error_rate=0.01) as server:
+            settings.OPEN_AI_BASE_URL = server.url
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, slow_rate=0.0, slow_latency=0.0,
+                 error_rate=0.0, error_status=503, failing_models=(), stream_chunk_size=16, stream_chunk_delay=0.0):
+        self.httpd = _CompletionsHTTPServer((host, port), _CompletionsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.sample_latency = make_latency_sampler(latency)
+        self.httpd.slow_rate = slow_rate
+        self.httpd.slow_latency = slow_latency
+        self.httpd.error_rate = error_rate
+        self.httpd.error_status = error_status
+        self.httpd.failing_models = set(failing_models)
+        self.httpd.stream_chunk_size = stream_chunk_size
+        self.httpd.stream_chunk_delay = stream_chunk_delay
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests_count = 0
+        self.httpd.errors_count = 0
+        self.thread = None
+
+    @property
+    def requests_count(self):
+        return self.httpd.requests_count
+
+    @property
+    def errors_count(self):
+        return self.httpd.errors_count
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', default='fixed:0.5')
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--slow-latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--stream-chunk-size', type=int, default=16)
+    parser.add_argument('--stream-chunk-delay', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeCompletionsServer(
+        host=args.host, port=args.port, latency=args.latency, slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency, error_rate=args.error_rate, error_status=args.error_status,
+        stream_chunk_size=args.stream_chunk_size, stream_chunk_delay=args.stream_chunk_delay,
+    )
+    print(f'Fake OpenAI listening on {server.url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import json
+import re
+
+POINTS_RE = re.compile(r'(?<!\\)"points"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\s*[,}\s]')
+EVALUATION_START_RE = re.compile(r'(?<!\\)"criteria_evaluation"\s*:\s*"')
+PARTIAL_ESCAPE_RE = re.compile(r'\\(u[0-9a-fA-F]{0,3})?$')
+
+
+def _find_string_end(raw):
+    escaped = False
+    for index, char in enumerate(raw):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '"':
+            return index
+    return None
+
+
+def _decode_partial_string(raw):
+    # Drop an escape sequence cut in half by the chunk boundary; it is decoded on the next feed
+    match = PARTIAL_ESCAPE_RE.search(raw)
+    if match:
+        backslashes = len(raw[:match.start() + 1]) - len(raw[:match.start() + 1].rstrip('\\'))
+        if backslashes % 2 == 1:
+            raw = raw[:match.start()]
+    return json.loads(f'"{raw}"')
+
+
+class FunctionArgumentsStreamParser:
+    """
+    Incrementally parses the `evaluate_answer` arguments JSON as it streams in.
+
+    feed() returns the events that became complete with this fragment:
+      {'event': 'points', 'points': 7.5}
+      {'event': 'evaluation', 'text': '- **Критерий 1 ...**: **2/3**. ...'}   one per finished line
+    `buffer` holds the full arguments document once the stream ends.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.points_emitted = False
+        self.evaluation_done = False
+        self.evaluation_lines_seen = 0
+
+    def feed(self, fragment: str) -> list[dict]:
+        self.buffer += fragment
+        events = []
+
+        if not self.points_emitted:
+            match = POINTS_RE.search(self.buffer)
+            if match:
+                self.points_emitted = True
+                events.append({'event': 'points', 'points': float(match.group(1))})
+
+        if not self.evaluation_done:
+            events.extend(self._evaluation_events())
+        return events
+
+    def _evaluation_events(self):
+        match = EVALUATION_START_RE.search(self.buffer)
+        if not match:
+            return []
+
+        raw = self.buffer[match.end():]
+        end = _find_string_end(raw)
+        if end is not None:
+            self.evaluation_done = True
+            lines = json.loads(f'"{raw[:end]}"').split('\n')
+        else:
+            # The last line may still be growing
+            lines = _decode_partial_string(raw).split('\n')[:-1]
+
+        new_lines = lines[self.evaluation_lines_seen:]
+        self.evaluation_lines_seen = len(lines)
+        return [{'event': 'evaluation', 'text': line.strip()} for line in new_lines if line.strip()]
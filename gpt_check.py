@@ -1,7 +1,10 @@
 import json
+import logging
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import openai
-import requests
+from asgiref.sync import sync_to_async
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
@@ -9,129 +12,180 @@ from rest_framework.response import Response
 from schoolproj import settings
 from teacher_data.serializers.questions_get import QuestionClonePayloadGetSerializer, QuestionPayloadGetSerializer
 from training_test.models import QuestionClone, Question, TopicHandbook
-from training_test.views.question.gpt_message import get_function_and_messages
+from training_test.views.question.gpt_message import detect_language, get_function_and_messages
+from training_test.views.question.grading_context_cache import get_cached_context, get_cached_contexts, \
+    set_cached_context, set_cached_contexts
+from training_test.views.question.grading_cache import get_cached_grade, make_grading_key, set_cached_grade
+from training_test.views.question.prompt_serializer import estimate_tokens, serialize_question_for_prompt
+from training_test.views.question.grading_metrics import current_trace, start_trace
+from training_test.views.question.function_call_stream import FunctionArgumentsStreamParser
+from training_test.views.question.gpt_transport import (
+    apost_chat_completion, is_fallback_response, post_chat_completion, stream_chat_completion,
+)
+from training_test.views.question.local_grader import CLOSED_QUESTION_TYPES, extract_answer_key, grade_closed_answer
+
+logger = logging.getLogger('grading.check')
 
 openai.api_key = settings.OPEN_AI_KEY
 MAX_RESPONSE_LENGTH = 1000
+GPT_BULK_MAX_WORKERS = getattr(settings, 'GPT_BULK_MAX_WORKERS', 8)
 
 def sanitize_input(student_response):
     sanitized_response = re.sub(r'[<>/{}[\]`~]', '', student_response)
     sanitized_response = sanitized_response.strip()
     return sanitized_response
 
-def check_by_gpt(question_or_clone_id : int, is_clone, student_response) -> Response:
-    #pdb.set_trace()
-    if is_clone:
-        try:
-            question_clone_instance = QuestionClone.objects.select_related('question__test__topic__section__subject', 'payload').get(id=question_or_clone_id)
-            test_instance = question_clone_instance.question.test
-            difficulty_name = question_clone_instance.difficulty.name
-
-            if question_clone_instance.question_type == 'open':
-                question_serializer = QuestionClonePayloadGetSerializer(question_clone_instance)
-                question_serializer_data = question_serializer.data
-                if question_serializer_data and 'payload' in question_serializer_data and 'criteria' in question_serializer_data['payload']:
-                    criteria = question_serializer_data['payload']['criteria']
-                else:
-                    criteria = ''
-            else:
-                criteria = ''
+def _get_criteria(question_type, question_details):
+    if question_type == 'open' and question_details and 'payload' in question_details \
+            and question_details['payload'] and 'criteria' in question_details['payload']:
+        return question_details['payload']['criteria']
+    return ''
 
-        except QuestionClone.DoesNotExist:
-            return Response(
-                {'detail': 'Вопрос не найден'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        except ObjectDoesNotExist:
-            return Response(
-                {'detail': 'Тест не найден'},
-                status=status.HTTP_404_NOT_FOUND
-            )
 
-        serializer = QuestionClonePayloadGetSerializer(question_clone_instance)
-        question_details = serializer.data
-    else:
-        try:
-            question_instance = Question.objects.select_related('test__topic__section__subject', 'payload').get(id=question_or_clone_id)
-            if question_instance.question_type == 'open':
-                question_serializer = QuestionPayloadGetSerializer(question_instance)
-                question_serializer_data = question_serializer.data
-                if question_serializer_data and 'payload' in question_serializer_data and 'criteria' in \
-                        question_serializer_data['payload']:
-                    criteria = question_serializer_data['payload']['criteria']
-                else:
-                    criteria = ''
-            else:
-                criteria = ''
+def _choose_gpt_model(subject_name):
+    if detect_language(subject_name) == 'kaz':
+        return 'gpt-4o'
+    return 'gpt-4o-mini'
 
-            test_instance = question_instance.test
-            difficulty_name = question_instance.difficulty.name
 
-        except Question.DoesNotExist:
-            return Response(
-                {'detail': 'Вопрос не найден'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+def build_grading_context(instance, is_clone, goals, trace=None) -> dict:
+    """
+    Everything the prompt needs about a question or clone, independent of the student's answer.
+    `instance` must have test/topic/section/subject loaded via select_related.
+    """
+    trace = trace if trace is not None else current_trace()
+    with trace.stage('serialize'):
+        if is_clone:
+            question_details = QuestionClonePayloadGetSerializer(instance).data
+            test_instance = instance.question.test
+        else:
+            question_details = QuestionPayloadGetSerializer(instance).data
+            test_instance = instance.test
+        prompt_question_details = serialize_question_for_prompt(question_details)
 
-        except ObjectDoesNotExist:
-            return Response(
-                {'detail': 'Тест не найден'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+    topic_instance = test_instance.topic
+    subject_name = topic_instance.section.subject.name
 
-        serializer = QuestionPayloadGetSerializer(question_instance)
-        question_details = serializer.data
+    return {
+        'question_type': instance.question_type,
+        'question_details': prompt_question_details,
+        'prompt_tokens': estimate_tokens(prompt_question_details),
+        'criteria': _get_criteria(instance.question_type, question_details),
+        'answer_key': extract_answer_key(instance.question_type, question_details.get('payload')),
+        'student_goal': goals.get(instance.difficulty.name),
+        'subject_name': subject_name,
+        'topic_name': topic_instance.name,
+        'gpt_model': _choose_gpt_model(subject_name),
+    }
 
-    sanitized_student_response = sanitize_input(student_response)
 
+def load_grading_context(question_or_clone_id : int, is_clone, trace=None) -> dict | Response:
+    trace = trace if trace is not None else current_trace()
     try:
-        topic_instance = test_instance.topic
-        goals = TopicHandbook.objects.get(topic=topic_instance).goals
-        student_goal = goals.get(difficulty_name)
-
-        subject_name = topic_instance.section.subject.name
-
-        if 'казах' in subject_name.lower() or 'қазақ' in subject_name.lower():
-            gpt_model = 'gpt-4o'
-        else:
-            gpt_model = 'gpt-4o-mini'
+        with trace.stage('orm'):
+            if is_clone:
+                instance = QuestionClone.objects.select_related(
+                    'question__test__topic__section__subject', 'payload', 'difficulty'
+                ).get(id=question_or_clone_id)
+                topic_instance = instance.question.test.topic
+            else:
+                instance = Question.objects.select_related(
+                    'test__topic__section__subject', 'payload', 'difficulty'
+                ).get(id=question_or_clone_id)
+                topic_instance = instance.test.topic
+    except (QuestionClone.DoesNotExist, Question.DoesNotExist):
+        return Response(
+            {'detail': 'Вопрос не найден'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except ObjectDoesNotExist:
+        return Response(
+            {'detail': 'Тест не найден'},
+            status=status.HTTP_404_NOT_FOUND
+        )
 
-        topic_name = topic_instance.name
+    try:
+        with trace.stage('orm'):
+            goals = TopicHandbook.objects.get(topic=topic_instance).goals
+        return build_grading_context(instance, is_clone, goals, trace)
     except ObjectDoesNotExist:
         return Response(
             {'detail': 'Предмет, тема или цель не найдены'},
             status=status.HTTP_404_NOT_FOUND
         )
 
+
+def get_grading_context(question_or_clone_id : int, is_clone, trace=None) -> dict | Response:
+    trace = trace if trace is not None else current_trace()
+    with trace.stage('context_cache'):
+        context = get_cached_context(question_or_clone_id, is_clone)
+    trace.set(context_cache_hit=context is not None)
+    if context is not None:
+        return context
+
+    context = load_grading_context(question_or_clone_id, is_clone, trace)
+    if not isinstance(context, Response):
+        set_cached_context(question_or_clone_id, is_clone, context)
+    return context
+
+
+def build_grading_request(context : dict, question_or_clone_id : int, is_clone, student_response, trace=None) -> dict:
+    sanitized_student_response = sanitize_input(student_response)
     if len(sanitized_student_response) > MAX_RESPONSE_LENGTH:
         raise ValidationError('Ваш ответ слишком длинный')
 
-    fn_mes_dict = get_function_and_messages(subject_name, topic_name, student_goal, question_details, sanitized_student_response, criteria)
+    trace = trace if trace is not None else current_trace()
+    trace.set(
+        model=context['gpt_model'],
+        lang=detect_language(context['subject_name']),
+        question_type=context.get('question_type'),
+        question_tokens_estimate=context.get('prompt_tokens'),
+    )
+    with trace.stage('prompt'):
+        fn_mes_dict = get_function_and_messages(
+            context['subject_name'], context['topic_name'], context['student_goal'],
+            context['question_details'], sanitized_student_response, context['criteria']
+        )
 
     function = fn_mes_dict.get("function")
     messages = fn_mes_dict.get("messages")
 
+    cache_key = make_grading_key(question_or_clone_id, is_clone, sanitized_student_response, context['criteria'],
+                                 context['gpt_model'], context['question_details'], context['student_goal'])
 
-    response = requests.post(
-        'https://api.openai.com/v1/chat/completions',
-        headers={
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {openai.api_key}',
-        },
-        json={
-            'model': gpt_model,
-            'messages': messages ,
+    return {
+        'cache_key': cache_key,
+        'payload': {
+            'model': context['gpt_model'],
+            'messages': messages,
             'functions': [function],
             'function_call': {'name': 'evaluate_answer'},
             'temperature': 0.2,
-        }
-    )
+        },
+    }
 
-    #print(response.content)
 
-    response.raise_for_status()
-    response_data = response.json()
+def prepare_grading_request(question_or_clone_id : int, is_clone, student_response) -> dict | Response:
+    context = get_grading_context(question_or_clone_id, is_clone)
+    if isinstance(context, Response):
+        return context
+    return build_grading_request(context, question_or_clone_id, is_clone, student_response)
 
+
+def parse_grading_arguments(arguments) -> dict:
+    arguments = arguments.decode('utf-8') if isinstance(arguments, bytes) else arguments
+
+    try:
+        parsed_arguments = json.loads(arguments)
+    except json.JSONDecodeError:
+        raise ValueError("Некорректный JSON в ответе от OpenAI API")
+
+    if parsed_arguments.get('moderation_flag'):
+        parsed_arguments['points'] = 0
+    return parsed_arguments
+
+
+def parse_grading_response(response_data: dict) -> dict:
     if 'choices' not in response_data or not response_data['choices']:
         raise ValueError("Некорректный ответ от OpenAI API")
 
@@ -139,16 +193,276 @@ def check_by_gpt(question_or_clone_id : int, is_clone, student_response) -> Resp
     function_call = message.get('function_call')
 
     if function_call and function_call.get('arguments'):
-        arguments = function_call['arguments']
-        arguments = arguments.decode('utf-8') if isinstance(arguments, bytes) else arguments
-
-        try:
-            parsed_arguments = json.loads(arguments)
-            if parsed_arguments.get('moderation_flag'):
-                parsed_arguments['points'] = 0
-            #print(f"Parsed Arguments: {parsed_arguments}")  # For debugging
-            return parsed_arguments
-        except json.JSONDecodeError:
-            raise ValueError("Некорректный JSON в ответе от OpenAI API")
+        return parse_grading_arguments(function_call['arguments'])
     else:
         raise ValueError("Получено пустое содержимое от OpenAI API")
+
+
+def is_closed_question(context : dict) -> bool:
+    # Without a recognised answer key in the payload the question still goes to the LLM
+    return context.get('question_type') in CLOSED_QUESTION_TYPES and context.get('answer_key') is not None
+
+
+def grade_locally(context : dict, student_response, trace=None) -> dict:
+    trace = trace if trace is not None else current_trace()
+    trace.set(grader='local', question_type=context['question_type'])
+    with trace.stage('local'):
+        try:
+            return grade_closed_answer(context['question_type'], context['answer_key'], student_response)
+        except (TypeError, ValueError) as e:
+            raise ValidationError(str(e))
+
+
+def grade_with_context(context : dict, question_or_clone_id : int, is_clone, student_response) -> tuple[dict, bool]:
+    """Returns the parsed grade and whether it came from the grading cache."""
+    if is_closed_question(context):
+        return grade_locally(context, student_response), False
+
+    trace = current_trace()
+    grading_request = build_grading_request(context, question_or_clone_id, is_clone, student_response)
+
+    with trace.stage('grade_cache'):
+        cached_result = get_cached_grade(grading_request['cache_key'])
+    trace.set(grade_cache_hit=cached_result is not None)
+    if cached_result is not None:
+        return dict(cached_result), True
+
+    with trace.stage('http'):
+        response_data = post_chat_completion(grading_request['payload'])
+    trace.record_usage(response_data)
+    with trace.stage('parse'):
+        result = parse_grading_response(response_data)
+    # The key is built from the requested model; a fallback grade must not be served as its answer
+    if not is_fallback_response(grading_request['payload'], response_data):
+        set_cached_grade(grading_request['cache_key'], result)
+    return result, False
+
+
+def check_by_gpt(question_or_clone_id : int, is_clone, student_response) -> dict | Response:
+    trace = start_trace('check_by_gpt')
+    outcome = 'error'
+    try:
+        context = get_grading_context(question_or_clone_id, is_clone)
+        if isinstance(context, Response):
+            return context
+
+        result, _ = grade_with_context(context, question_or_clone_id, is_clone, student_response)
+        outcome = 'ok'
+        return result
+    finally:
+        trace.finish(outcome)
+
+
+def _timed_fragments(fragments, trace):
+    """Yields stream fragments; only the wait for each one counts towards 'http', not the consumer's time."""
+    fragments = iter(fragments)
+    while True:
+        with trace.stage('http'):
+            fragment = next(fragments, None)
+        if fragment is None:
+            return
+        yield fragment
+
+
+def stream_check_by_gpt(question_or_clone_id : int, is_clone, student_response):
+    """
+    Generator of grading events for a streaming response:
+      {'event': 'points', ...} and {'event': 'evaluation', ...} as soon as they are complete,
+      then exactly one {'event': 'result', 'result': {...}} or {'event': 'error', ...}.
+    Points in the early event are provisional: moderation_flag is applied only to the final result.
+    """
+    # Not bound to the context: a generator resumes wherever the response is iterated, so the trace is passed explicitly
+    trace = start_trace('stream_check_by_gpt', bind=False)
+    outcome = 'error'
+    try:
+        with trace.stage('context'):
+            context = get_grading_context(question_or_clone_id, is_clone, trace)
+        if isinstance(context, Response):
+            yield {'event': 'error', 'detail': context.data['detail'], 'status': context.status_code}
+            return
+
+        try:
+            if is_closed_question(context):
+                result = grade_locally(context, student_response, trace)
+                outcome = 'ok'
+                yield {'event': 'result', 'result': result}
+                return
+            grading_request = build_grading_request(context, question_or_clone_id, is_clone, student_response, trace)
+        except ValidationError as e:
+            yield {'event': 'error', 'detail': e.detail[0] if isinstance(e.detail, list) else str(e.detail),
+                   'status': status.HTTP_400_BAD_REQUEST}
+            return
+
+        with trace.stage('grade_cache'):
+            cached_result = get_cached_grade(grading_request['cache_key'])
+        trace.set(grade_cache_hit=cached_result is not None)
+        if cached_result is not None:
+            outcome = 'ok'
+            yield {'event': 'result', 'result': dict(cached_result)}
+            return
+
+        parser = FunctionArgumentsStreamParser()
+        try:
+            for fragment in _timed_fragments(stream_chat_completion(grading_request['payload']), trace):
+                yield from parser.feed(fragment)
+            if not parser.buffer:
+                raise ValueError("Получено пустое содержимое от OpenAI API")
+            result = parse_grading_arguments(parser.buffer)
+        except Exception:
+            # The exception text may carry upstream URLs and response bodies; it goes to the log only
+            logger.exception('Streaming grade failed for %s %s', 'clone' if is_clone else 'question', question_or_clone_id)
+            yield {'event': 'error', 'detail': 'Не удалось получить оценку от OpenAI', 'status': status.HTTP_502_BAD_GATEWAY}
+            return
+
+        set_cached_grade(grading_request['cache_key'], result)
+        outcome = 'ok'
+        yield {'event': 'result', 'result': result}
+    finally:
+        trace.finish(outcome)
+
+
+def to_server_sent_events(events):
+    """Formats grading events for StreamingHttpResponse(..., content_type='text/event-stream')."""
+    for event in events:
+        yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def acheck_by_gpt(question_or_clone_id : int, is_clone, student_response) -> dict | Response:
+    # ORM and serializer work stays synchronous; only the OpenAI round-trip is awaited
+    trace = start_trace('acheck_by_gpt')
+    outcome = 'error'
+    try:
+        context = await sync_to_async(get_grading_context)(question_or_clone_id, is_clone)
+        if isinstance(context, Response):
+            return context
+
+        if is_closed_question(context):
+            result = grade_locally(context, student_response)
+            outcome = 'ok'
+            return result
+
+        grading_request = build_grading_request(context, question_or_clone_id, is_clone, student_response)
+
+        with trace.stage('grade_cache'):
+            cached_result = await sync_to_async(get_cached_grade)(grading_request['cache_key'])
+        trace.set(grade_cache_hit=cached_result is not None)
+        if cached_result is not None:
+            outcome = 'ok'
+            return dict(cached_result)
+
+        with trace.stage('http'):
+            response_data = await apost_chat_completion(grading_request['payload'])
+        trace.record_usage(response_data)
+        with trace.stage('parse'):
+            result = parse_grading_response(response_data)
+        if not is_fallback_response(grading_request['payload'], response_data):
+            await sync_to_async(set_cached_grade)(grading_request['cache_key'], result)
+        outcome = 'ok'
+        return result
+    finally:
+        trace.finish(outcome)
+
+
+def load_grading_contexts(keys) -> dict:
+    """
+    Bulk variant of get_grading_context for (question_or_clone_id, is_clone) pairs:
+    one cache read, then one query for questions, one for clones and one for handbooks
+    for whatever is missing. Missing objects map to the same 404 Response the single path returns.
+    """
+    keys = set(keys)
+    contexts = get_cached_contexts(keys)
+    missing_keys = keys - set(contexts)
+    if not missing_keys:
+        return contexts
+
+    question_ids = {question_id for question_id, is_clone in missing_keys if not is_clone}
+    clone_ids = {clone_id for clone_id, is_clone in missing_keys if is_clone}
+
+    questions = Question.objects.select_related(
+        'test__topic__section__subject', 'payload', 'difficulty'
+    ).in_bulk(question_ids) if question_ids else {}
+    clones = QuestionClone.objects.select_related(
+        'question__test__topic__section__subject', 'payload', 'difficulty'
+    ).in_bulk(clone_ids) if clone_ids else {}
+
+    topic_ids = {question.test.topic_id for question in questions.values()}
+    topic_ids |= {clone.question.test.topic_id for clone in clones.values()}
+    goals_by_topic = dict(TopicHandbook.objects.filter(topic_id__in=topic_ids).values_list('topic_id', 'goals'))
+
+    loaded_contexts = {}
+    for question_or_clone_id, is_clone in missing_keys:
+        instance = clones.get(question_or_clone_id) if is_clone else questions.get(question_or_clone_id)
+        if instance is None:
+            contexts[(question_or_clone_id, is_clone)] = Response(
+                {'detail': 'Вопрос не найден'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+            continue
+
+        test_instance = instance.question.test if is_clone else instance.test
+        if test_instance.topic_id not in goals_by_topic:
+            contexts[(question_or_clone_id, is_clone)] = Response(
+                {'detail': 'Предмет, тема или цель не найдены'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+            continue
+
+        loaded_contexts[(question_or_clone_id, is_clone)] = build_grading_context(
+            instance, is_clone, goals_by_topic[test_instance.topic_id]
+        )
+
+    set_cached_contexts(loaded_contexts)
+    contexts.update(loaded_contexts)
+    return contexts
+
+
+def check_by_gpt_many(items, max_workers : int | None = None) -> dict:
+    """
+    Grades a batch of (question_or_clone_id, is_clone, student_response) tuples.
+
+    Returns {'results': [...], 'stats': {...}} where results keep the input order and
+    each entry has either 'result' or 'error' set.
+    """
+    items = list(items)
+    started = time.perf_counter()
+    contexts = load_grading_contexts([(question_or_clone_id, bool(is_clone)) for question_or_clone_id, is_clone, _ in items])
+
+    def grade_item(item):
+        question_or_clone_id, is_clone, student_response = item
+        entry = {'question_or_clone_id': question_or_clone_id, 'is_clone': is_clone, 'result': None, 'error': None}
+        context = contexts[(question_or_clone_id, bool(is_clone))]
+        if isinstance(context, Response):
+            entry['error'] = context.data['detail']
+            return entry, False
+
+        trace = start_trace('check_by_gpt_many')
+        try:
+            entry['result'], cache_hit = grade_with_context(context, question_or_clone_id, is_clone, student_response)
+        except ValidationError as e:
+            entry['error'] = e.detail[0] if isinstance(e.detail, list) else str(e.detail)
+            return entry, False
+        except Exception as e:
+            entry['error'] = str(e)
+            return entry, False
+        finally:
+            trace.finish('ok' if entry['error'] is None else 'error')
+        return entry, cache_hit
+
+    with ThreadPoolExecutor(max_workers=max_workers or GPT_BULK_MAX_WORKERS) as executor:
+        graded = list(executor.map(grade_item, items))
+
+    elapsed = time.perf_counter() - started
+    results = [entry for entry, _ in graded]
+    errors = sum(1 for entry in results if entry['error'] is not None)
+    return {
+        'results': results,
+        'stats': {
+            'count': len(results),
+            'graded': len(results) - errors,
+            'errors': errors,
+            'cache_hits': sum(1 for _, cache_hit in graded if cache_hit),
+            'distinct_questions': len(contexts),
+            'elapsed_seconds': elapsed,
+            'per_second': len(results) / elapsed if elapsed else 0.0,
+        },
+    }
@@ -1,55 +1,19 @@
+"""
+Localized prompt templates for grading open answers in Kazakh (kaz), Russian (rus) and English (eng).
 
-def get_function_and_messages(subject_name, topic_name, student_goal, question_details, sanitized_student_response, criteria=None):
-    if 'казах' in subject_name.lower() or 'қазақ' in subject_name.lower():
-        lang = 'kaz'
-    elif 'англ' in subject_name.lower() or 'eng' in subject_name.lower() or 'ағылшын' in subject_name.lower():
-        lang = 'eng'
-
-    else:
-        lang = 'rus'
-    """
-    Returns a dictionary with localized strings for:
-      - user_text
-      - criteria
-      - eval_by_criteria
-      - function
-      - messages
-    in Kazakh (kaz), Russian (rus), and English (eng).
-    """
+The `function` schemas depend only on the language and on whether criteria are given,
+so they are built once per (lang, has_criteria) on first use and shared between calls.
+Only the selected language's messages are rendered per grade.
+"""
+from functools import lru_cache
 
-    # ---------------------------
-    # 1) user_text
-    # ---------------------------
-    user_text_kaz = (
-        f"Сұрақ: {question_details}\n"
-        f"Студенттің жауабы: {sanitized_student_response}"
-    )
-    user_text_rus = (
-        f"Вопрос: {question_details}\n"
-        f"Ответ студента: {sanitized_student_response}"
-    )
-    user_text_eng = (
-        f"Question: {question_details}\n"
-        f"Student's answer: {sanitized_student_response}"
-    )
-
-    # ---------------------------
-    # 2) criteria
-    # ---------------------------
-    # If `criteria` is provided by the user, you can either leave it in the original language
-    # or provide a translated version here. Below, we show how to keep it in the original language
-    # (i.e. do not translate user-provided criteria). If you want a translation, replace accordingly.
-
-    criteria_kaz = criteria if criteria else ""
-    criteria_rus = criteria if criteria else ""
-    criteria_eng = criteria if criteria else ""
-
-    # ---------------------------
-    # 3) eval_by_criteria
-    # ---------------------------
+# ---------------------------
+# eval_by_criteria
+# ---------------------------
+EVAL_BY_CRITERIA = {
     # Russian version (original code)
-    eval_by_criteria_rus = (
-        f"Оцени ответ ученика на основании критериев, указанных в поле [критерий + макс. балл ... ]:\n"
+    "rus": (
+        "Оцени ответ ученика на основании критериев, указанных в поле [критерий + макс. балл ... ]:\n"
         "1. Укажи, какой процент из максимума начислен по этому критерию.\n"
         "2. Объясни, почему начислено именно столько.\n"
         "3. Если ученик не набрал полный балл, уточни, что необходимо доработать.\n\n"
@@ -60,11 +24,9 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
         "- **Критерий 3 (Примеры, 2)**: **1.5/2**. Приведены два примера, однако...\n"
         "- **Критерий 4 (Обоснование, 2)**: **2/2**. Все выводы обоснованы...\n"
         "- **Критерий 5 (Ясность, 1)**: **1/1**. Ответ изложен четко..."
-    )
-
-    # Kazakh version
-    eval_by_criteria_kaz = (
-        f"Студенттің жауабын төменде көрсетілген критерийлерге сәйкес бағалаңыз ([критерий + макс. балл ... ]):\n"
+    ),
+    "kaz": (
+        "Студенттің жауабын төменде көрсетілген критерийлерге сәйкес бағалаңыз ([критерий + макс. балл ... ]):\n"
         "1. Әр критерий бойынша ең жоғары балдың қандай пайызы берілгенін көрсетіңіз.\n"
         "2. Неліктен дәл сондай ұпай қойылғанын түсіндіріңіз.\n"
         "3. Егер толық балл қойылмаса, қандай жетілдіру қажет екенін көрсетіңіз.\n\n"
@@ -75,11 +37,9 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
         "- **Критерий 3 (Мысалдар, 2)**: **1.5/2**. Екі мысал келтірілді, бірақ...\n"
         "- **Критерий 4 (Негіздеме, 2)**: **2/2**. Барлық тұжырымдар негізді...\n"
         "- **Критерий 5 (Түсініктілік, 1)**: **1/1**. Жауап анық жазылған..."
-    )
-
-    # English version
-    eval_by_criteria_eng = (
-        f"Evaluate the student's answer based on the criteria shown here ([criterion + max points ... ]):\n"
+    ),
+    "eng": (
+        "Evaluate the student's answer based on the criteria shown here ([criterion + max points ... ]):\n"
         "1. State the percentage of the maximum points awarded for each criterion.\n"
         "2. Explain why exactly this score was awarded.\n"
         "3. If the student did not receive full points, clarify what needs improvement.\n\n"
@@ -90,21 +50,72 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
         "- **Criterion 3 (Examples, 2)**: **1.5/2**. Two examples are given, however...\n"
         "- **Criterion 4 (Justification, 2)**: **2/2**. All conclusions are justified...\n"
         "- **Criterion 5 (Clarity, 1)**: **1/1**. The answer is clear and well structured..."
-    )
+    ),
+}
+
+# If no criteria are provided, we use a shorter instruction
+EVAL_WITHOUT_CRITERIA = {
+    "rus": "Оцени ответ ученика с пояснением, почему именно такая оценка. Максимальный балл: 10",
+    "kaz": "Студенттің жауабын бағалап, не себепті дәл сондай баға қойылғанын түсіндіріңіз. Максималды балл: 10",
+    "eng": "Evaluate the student's answer, explaining why that score is awarded. Maximum score: 10",
+}
 
-    # If no criteria are provided, we use a shorter instruction
-    if not criteria:
-        eval_by_criteria_rus = "Оцени ответ ученика с пояснением, почему именно такая оценка. Максимальный балл: 10"
-        eval_by_criteria_kaz = "Студенттің жауабын бағалап, не себепті дәл сондай баға қойылғанын түсіндіріңіз. Максималды балл: 10"
-        eval_by_criteria_eng = "Evaluate the student's answer, explaining why that score is awarded. Maximum score: 10"
+# ---------------------------
+# user_text
+# ---------------------------
+USER_TEXT = {
+    "kaz": "Сұрақ: {question_details}\nСтуденттің жауабы: {sanitized_student_response}",
+    "rus": "Вопрос: {question_details}\nОтвет студента: {sanitized_student_response}",
+    "eng": "Question: {question_details}\nStudent's answer: {sanitized_student_response}",
+}
 
-    # ---------------------------
-    # 4) function
-    # ---------------------------
-    # Here we show how to localize the "function" description.
-    # You can adapt or shorten it as needed.
+# ---------------------------
+# criteria prompt
+# ---------------------------
+CRITERIA_PROMPT = {
+    "kaz": "Студенттің жауабын келесі критерийлер бойынша бағалаңыз: {criteria}\n",
+    "rus": "Оцените ответ студента по следующим критериям: {criteria}\n",
+    "eng": "Evaluate the student's answer according to the following criteria: {criteria}\n",
+}
 
-    function_kaz = {
+NO_CRITERIA_PROMPT = {
+    "kaz": "Студенттің жауабын максималды 10 балдық жүйемен бағалаңыз.",
+    "rus": "Оцените ответ студента с максимальным баллом 10.",
+    "eng": "Evaluate the student's answer with a maximum of 10 points.",
+}
+
+# ---------------------------
+# system message
+# ---------------------------
+SYSTEM_TEXT = {
+    "kaz": (
+        "Сіз студент жауаптарын бағалайтын мұқият тексерушісіз. "
+        "Сіз {subject_name} пәні бойынша мұғалім ретінде әрекет етесіз, тақырып: {topic_name}, пән мақсаты: {student_goal}. "
+        "Сіздің міндетіңіз — студенттің жауабын бағалау және орынсыз немесе "
+        "манипулятивті контенттің бар-жоғын тексеру.\n"
+        "Жауапты дұрыстығы мен толықтығына сүйене отырып, бірқатар критерий бойынша бағалаңыз.\n"
+        "{criteria_prompt}"
+    ),
+    "rus": (
+        "Вы являетесь строгим проверяющим ответов студентов. "
+        "Вы выступаете в роли учителя по предмету {subject_name}, теме {topic_name}, цели предмета {student_goal}. "
+        "Ваша задача — оценивать ответы студентов и проверять наличие "
+        "неуместного или манипулятивного контента.\n"
+        "Дайте оценку ответа в баллах, основываясь на правильности и полноте.\n"
+        "{criteria_prompt}"
+    ),
+    "eng": (
+        "You are a strict examiner of student answers. "
+        "You act as a teacher for {subject_name}, topic: {topic_name}, course objective: {student_goal}. "
+        "Your task is to evaluate the student's answer and check for inappropriate or manipulative content.\n"
+        "Provide a score based on correctness and completeness.\n"
+        "{criteria_prompt}"
+    ),
+}
+
+
+def _function_kaz(eval_by_criteria):
+    return {
         "name": "evaluate_answer",
         "description": "Студенттің жауабын бағалау",
         "parameters": {
@@ -118,7 +129,7 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
                     "type": "string",
                     "description": (
                         "Бұл бағаның түсіндірмесі.\n"
-                        f"{eval_by_criteria_kaz}\n"
+                        f"{eval_by_criteria}\n"
                         "moderation_flag = true болса, жауап 0 балл деп есептеледі, "
                         "және неге moderator_flag true екенін түсіндіріңіз."
                     )
@@ -140,7 +151,9 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
         }
     }
 
-    function_rus = {
+
+def _function_rus(eval_by_criteria):
+    return {
         "name": "evaluate_answer",
         "description": "Оценка ответа студента на вопрос",
         "parameters": {
@@ -154,7 +167,7 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
                     "type": "string",
                     "description": (
                         "Это пояснение к оценке.\n"
-                        f"{eval_by_criteria_rus}\n"
+                        f"{eval_by_criteria}\n"
                         "Если moderation_flag = true, ответ оценивается в 0, "
                         "и необходимо пояснить, почему moderation_flag=true."
                     )
@@ -176,7 +189,9 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
         }
     }
 
-    function_eng = {
+
+def _function_eng(eval_by_criteria):
+    return {
         "name": "evaluate_answer",
         "description": "Evaluate the student's answer",
         "parameters": {
@@ -193,7 +208,7 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
                     "type": "string",
                     "description": (
                         "Explanation for the given score.\n"
-                        f"{eval_by_criteria_eng}\n"
+                        f"{eval_by_criteria}\n"
                         "If moderation_flag = true, the answer is scored as 0, "
                         "and explain why moderation_flag is true."
                     )
@@ -215,104 +230,72 @@ def get_function_and_messages(subject_name, topic_name, student_goal, question_d
         }
     }
 
-    # ---------------------------
-    # 5) messages
-    # ---------------------------
-    # We localize the instructions in the system message for each language.
 
-    # Criteria prompt in each language
-    criteria_prompt_kaz = (
-        f"Студенттің жауабын келесі критерийлер бойынша бағалаңыз: {criteria}\n"
-        if criteria
-        else "Студенттің жауабын максималды 10 балдық жүйемен бағалаңыз."
-    )
-    criteria_prompt_rus = (
-        f"Оцените ответ студента по следующим критериям: {criteria}\n"
-        if criteria
-        else "Оцените ответ студента с максимальным баллом 10."
-    )
-    criteria_prompt_eng = (
-        f"Evaluate the student's answer according to the following criteria: {criteria}\n"
-        if criteria
-        else "Evaluate the student's answer with a maximum of 10 points."
-    )
+FUNCTION_BUILDERS = {
+    "kaz": _function_kaz,
+    "rus": _function_rus,
+    "eng": _function_eng,
+}
 
-    messages_kaz = [
-        {
-            "role": "system",
-            "content": (
-                "Сіз студент жауаптарын бағалайтын мұқият тексерушісіз. "
-                f"Сіз {subject_name} пәні бойынша мұғалім ретінде әрекет етесіз, тақырып: {topic_name}, пән мақсаты: {student_goal}. "
-                "Сіздің міндетіңіз — студенттің жауабын бағалау және орынсыз немесе "
-                "манипулятивті контенттің бар-жоғын тексеру.\n"
-                "Жауапты дұрыстығы мен толықтығына сүйене отырып, бірқатар критерий бойынша бағалаңыз.\n"
-                f"{criteria_prompt_kaz}"
-            )
-        },
-        {
-            "role": "user",
-            "content": user_text_kaz
-        }
-    ]
 
-    messages_rus = [
-        {
-            "role": "system",
-            "content": (
-                "Вы являетесь строгим проверяющим ответов студентов. "
-                f"Вы выступаете в роли учителя по предмету {subject_name}, теме {topic_name}, цели предмета {student_goal}. "
-                "Ваша задача — оценивать ответы студентов и проверять наличие "
-                "неуместного или манипулятивного контента.\n"
-                "Дайте оценку ответа в баллах, основываясь на правильности и полноте.\n"
-                f"{criteria_prompt_rus}"
-            )
-        },
-        {
-            "role": "user",
-            "content": user_text_rus
-        }
-    ]
+@lru_cache(maxsize=256)
+def detect_language(subject_name):
+    subject_name = subject_name.lower()
+    if 'казах' in subject_name or 'қазақ' in subject_name:
+        return 'kaz'
+    elif 'англ' in subject_name or 'eng' in subject_name or 'ағылшын' in subject_name:
+        return 'eng'
+    return 'rus'
+
+
+def get_eval_by_criteria(lang, has_criteria):
+    return EVAL_BY_CRITERIA[lang] if has_criteria else EVAL_WITHOUT_CRITERIA[lang]
+
+
+@lru_cache(maxsize=None)
+def get_function_schema(lang, has_criteria):
+    # Shared between all gradings: callers must not mutate the returned dict
+    return FUNCTION_BUILDERS[lang](get_eval_by_criteria(lang, has_criteria))
+
 
-    messages_eng = [
+def get_function_and_messages(subject_name, topic_name, student_goal, question_details, sanitized_student_response, criteria=None):
+    """
+    Returns a dictionary with localized strings for the subject's language:
+      - user_text
+      - criteria
+      - eval_by_criteria
+      - function
+      - messages
+    """
+    lang = detect_language(subject_name)
+    has_criteria = bool(criteria)
+
+    user_text = USER_TEXT[lang].format(
+        question_details=question_details,
+        sanitized_student_response=sanitized_student_response,
+    )
+    criteria_prompt = CRITERIA_PROMPT[lang].format(criteria=criteria) if has_criteria else NO_CRITERIA_PROMPT[lang]
+
+    messages = [
         {
             "role": "system",
-            "content": (
-                "You are a strict examiner of student answers. "
-                f"You act as a teacher for {subject_name}, topic: {topic_name}, course objective: {student_goal}. "
-                "Your task is to evaluate the student's answer and check for inappropriate or manipulative content.\n"
-                "Provide a score based on correctness and completeness.\n"
-                f"{criteria_prompt_eng}"
+            "content": SYSTEM_TEXT[lang].format(
+                subject_name=subject_name,
+                topic_name=topic_name,
+                student_goal=student_goal,
+                criteria_prompt=criteria_prompt,
             )
         },
         {
             "role": "user",
-            "content": user_text_eng
+            "content": user_text
         }
     ]
 
-    localized_dict = {
-        "kaz": {
-            "user_text": user_text_kaz,
-            "criteria": criteria_kaz,
-            "eval_by_criteria": eval_by_criteria_kaz,
-            "function": function_kaz,
-            "messages": messages_kaz
-        },
-        "rus": {
-            "user_text": user_text_rus,
-            "criteria": criteria_rus,
-            "eval_by_criteria": eval_by_criteria_rus,
-            "function": function_rus,
-            "messages": messages_rus
-        },
-        "eng": {
-            "user_text": user_text_eng,
-            "criteria": criteria_eng,
-            "eval_by_criteria": eval_by_criteria_eng,
-            "function": function_eng,
-            "messages": messages_eng
-        }
+    return {
+        "user_text": user_text,
+        "criteria": criteria if criteria else "",
+        "eval_by_criteria": get_eval_by_criteria(lang, has_criteria),
+        "function": get_function_schema(lang, has_criteria),
+        "messages": messages
     }
-
-
-    return localized_dict.get(lang)
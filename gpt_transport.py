@@ -0,0 +1,383 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from schoolproj import settings
+
+OPEN_AI_BASE_URL = getattr(settings, 'OPEN_AI_BASE_URL', 'https://api.openai.com')
+CHAT_COMPLETIONS_URL = f'{OPEN_AI_BASE_URL.rstrip("/")}/v1/chat/completions'
+
+# Pool and timeouts are shared by every grading in the worker process
+OPEN_AI_POOL_SIZE = getattr(settings, 'OPEN_AI_POOL_SIZE', 20)
+OPEN_AI_CONNECT_TIMEOUT = getattr(settings, 'OPEN_AI_CONNECT_TIMEOUT', 5.0)
+OPEN_AI_READ_TIMEOUT = getattr(settings, 'OPEN_AI_READ_TIMEOUT', 60.0)  # per-attempt deadline
+OPEN_AI_MAX_CONCURRENCY = getattr(settings, 'OPEN_AI_MAX_CONCURRENCY', 200)
+
+# Latency policy: hedge a slow attempt, retry 429/5xx with jitter, then fall back to a cheaper model
+OPEN_AI_TOTAL_TIMEOUT = getattr(settings, 'OPEN_AI_TOTAL_TIMEOUT', 90.0)
+OPEN_AI_HEDGE_ENABLED = getattr(settings, 'OPEN_AI_HEDGE_ENABLED', True)
+OPEN_AI_HEDGE_PERCENTILE = getattr(settings, 'OPEN_AI_HEDGE_PERCENTILE', 0.95)
+OPEN_AI_HEDGE_DEFAULT_DELAY = getattr(settings, 'OPEN_AI_HEDGE_DEFAULT_DELAY', 10.0)
+OPEN_AI_HEDGE_MIN_SAMPLES = getattr(settings, 'OPEN_AI_HEDGE_MIN_SAMPLES', 20)
+# Hedged calls in flight (counted until their slower attempt finishes too), hedges per call and their read timeout
+OPEN_AI_HEDGE_MAX_CONCURRENCY = getattr(settings, 'OPEN_AI_HEDGE_MAX_CONCURRENCY', 20)
+OPEN_AI_MAX_HEDGES = getattr(settings, 'OPEN_AI_MAX_HEDGES', 2)
+OPEN_AI_HEDGE_READ_TIMEOUT = getattr(settings, 'OPEN_AI_HEDGE_READ_TIMEOUT', 15.0)
+OPEN_AI_MAX_RETRIES = getattr(settings, 'OPEN_AI_MAX_RETRIES', 2)
+OPEN_AI_RETRY_BASE_DELAY = getattr(settings, 'OPEN_AI_RETRY_BASE_DELAY', 0.5)
+OPEN_AI_RETRY_MAX_DELAY = getattr(settings, 'OPEN_AI_RETRY_MAX_DELAY', 8.0)
+OPEN_AI_FALLBACK_MODELS = getattr(settings, 'OPEN_AI_FALLBACK_MODELS', {'gpt-4o': 'gpt-4o-mini'})
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+_attempt_executor = None
+_hedge_executor = None
+
+_async_client = None
+_async_semaphore = None
+_async_loop = None
+
+
+class LatencyTracker:
+    """Sliding window of successful attempt latencies used to pick the hedge delay."""
+
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction):
+        with self._lock:
+            if len(self._samples) < OPEN_AI_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+latency_tracker = LatencyTracker()
+
+
+def get_headers():
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {openai.api_key}',
+    }
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide requests.Session with a keep-alive connection pool
+    so consecutive gradings reuse the TLS connection to OpenAI.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OPEN_AI_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _get_attempt_executor() -> ThreadPoolExecutor:
+    global _attempt_executor
+    if _attempt_executor is None:
+        with _session_lock:
+            if _attempt_executor is None:
+                _attempt_executor = ThreadPoolExecutor(max_workers=OPEN_AI_MAX_CONCURRENCY, thread_name_prefix='openai')
+    return _attempt_executor
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    # Hedges get threads of their own, so slow losers never hold up first attempts
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _session_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=OPEN_AI_HEDGE_MAX_CONCURRENCY * OPEN_AI_MAX_HEDGES, thread_name_prefix='openai-hedge'
+                )
+    return _hedge_executor
+
+
+class HedgeSlot:
+    """
+    One of OPEN_AI_HEDGE_MAX_CONCURRENCY hedged calls, held until every attempt of the call has finished,
+    winner or not. When all slots are taken (a slow upstream) calls simply stop hedging, which bounds
+    both the hedge threads and the losing first attempts left running in the attempt executor.
+    """
+    _slots = threading.BoundedSemaphore(OPEN_AI_HEDGE_MAX_CONCURRENCY)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = 0
+        self._released = False
+
+    @classmethod
+    def acquire(cls):
+        return cls() if cls._slots.acquire(blocking=False) else None
+
+    def track(self, future):
+        with self._lock:
+            self._running += 1
+        future.add_done_callback(self._finished)
+
+    def _finished(self, _):
+        with self._lock:
+            self._running -= 1
+            if self._running or self._released:
+                return
+            self._released = True
+        self._slots.release()
+
+
+def _attempt_timeout(deadline: float, limit: float = OPEN_AI_READ_TIMEOUT) -> float:
+    return min(limit, max(deadline - time.monotonic(), 0.001))
+
+
+def get_hedge_delay():
+    observed = latency_tracker.percentile(OPEN_AI_HEDGE_PERCENTILE)
+    return observed if observed is not None else OPEN_AI_HEDGE_DEFAULT_DELAY
+
+
+def get_retry_delay(attempt):
+    delay = min(OPEN_AI_RETRY_BASE_DELAY * 2 ** attempt, OPEN_AI_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.5)
+
+
+def is_retryable(error):
+    if isinstance(error, (requests.HTTPError, httpx.HTTPStatusError)):
+        return error.response is not None and error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, httpx.TransportError, TimeoutError))
+
+
+def _post_once(payload: dict, timeout: float) -> dict:
+    response = get_session().post(
+        CHAT_COMPLETIONS_URL,
+        headers=get_headers(),
+        json=payload,
+        timeout=(OPEN_AI_CONNECT_TIMEOUT, timeout),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _post_hedged(payload: dict, deadline: float) -> dict:
+    """
+    Sends one attempt and, if it is still running after the hedge delay, a second identical one
+    with a shorter read timeout; a hedge that fails while another attempt is still running is replaced,
+    up to OPEN_AI_MAX_HEDGES. The first successful response wins; the loser is left to finish in the background.
+    Only the winner's latency is recorded: losers are the slow tail hedging cuts off, and feeding
+    them back would push the hedge delay up until hedges stop firing.
+    """
+    attempt_timeout = _attempt_timeout(deadline)
+    future = _get_attempt_executor().submit(_post_once, payload, attempt_timeout)
+    started = {future: time.monotonic()}
+    pending = {future}
+    slot = None
+    hedges = 0
+
+    def submit_hedge():
+        future = _get_hedge_executor().submit(_post_once, payload, _attempt_timeout(deadline, OPEN_AI_HEDGE_READ_TIMEOUT))
+        started[future] = time.monotonic()
+        slot.track(future)
+        return future
+
+    if OPEN_AI_HEDGE_ENABLED:
+        done, pending = wait(pending, timeout=min(get_hedge_delay(), attempt_timeout))
+        if done:
+            pending = done
+        else:
+            slot = HedgeSlot.acquire()
+            if slot is not None:
+                slot.track(future)
+                pending.add(submit_hedge())
+                hedges += 1
+
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                latency_tracker.record(time.monotonic() - started[future])
+                return future.result()
+            error = future.exception()
+            if not is_retryable(error):
+                raise error
+        if pending and slot is not None and hedges < OPEN_AI_MAX_HEDGES:
+            # Failed fast: waiting for the slow attempt alone would throw the hedge away
+            pending.add(submit_hedge())
+            hedges += 1
+    raise error or TimeoutError('OpenAI request exceeded its deadline')
+
+
+def is_fallback_response(payload: dict, response_data: dict) -> bool:
+    """Whether the response came from the fallback model rather than the requested one."""
+    fallback_model = OPEN_AI_FALLBACK_MODELS.get(payload.get('model'))
+    # OpenAI reports the dated snapshot that answered, e.g. gpt-4o-mini-2024-07-18
+    return bool(fallback_model) and str(response_data.get('model') or '').startswith(fallback_model)
+
+
+def post_chat_completion(payload: dict) -> dict:
+    deadline = time.monotonic() + OPEN_AI_TOTAL_TIMEOUT
+    error = None
+    for attempt in range(OPEN_AI_MAX_RETRIES + 1):
+        try:
+            return _post_hedged(payload, deadline)
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            error = e
+        retry_delay = get_retry_delay(attempt)
+        if attempt == OPEN_AI_MAX_RETRIES or time.monotonic() + retry_delay >= deadline:
+            break
+        time.sleep(retry_delay)
+
+    fallback_model = OPEN_AI_FALLBACK_MODELS.get(payload.get('model'))
+    if fallback_model:
+        return _post_hedged({**payload, 'model': fallback_model}, time.monotonic() + OPEN_AI_READ_TIMEOUT)
+    raise error
+
+
+def stream_chat_completion(payload: dict):
+    """
+    Yields function_call.arguments fragments from a streamed completion.
+    No hedging here: a second stream cannot be merged with the one already being shown.
+    """
+    with get_session().post(
+        CHAT_COMPLETIONS_URL,
+        headers=get_headers(),
+        json={**payload, 'stream': True},
+        timeout=(OPEN_AI_CONNECT_TIMEOUT, OPEN_AI_READ_TIMEOUT),
+        stream=True,
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            if not chunk.get('choices'):
+                continue
+            function_call = chunk['choices'][0].get('delta', {}).get('function_call') or {}
+            if function_call.get('arguments'):
+                yield function_call['arguments']
+
+
+def _get_async_transport():
+    # httpx clients and asyncio semaphores are bound to the loop they were created on
+    global _async_client, _async_semaphore, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=OPEN_AI_POOL_SIZE, max_keepalive_connections=OPEN_AI_POOL_SIZE),
+            timeout=httpx.Timeout(OPEN_AI_READ_TIMEOUT, connect=OPEN_AI_CONNECT_TIMEOUT),
+        )
+        _async_semaphore = asyncio.Semaphore(OPEN_AI_MAX_CONCURRENCY)
+        _async_loop = loop
+    return _async_client, _async_semaphore
+
+
+async def _apost_once(payload: dict, timeout: float) -> dict:
+    client, semaphore = _get_async_transport()
+    async with semaphore:
+        response = await client.post(
+            CHAT_COMPLETIONS_URL,
+            headers=get_headers(),
+            json=payload,
+            timeout=httpx.Timeout(timeout, connect=OPEN_AI_CONNECT_TIMEOUT),
+        )
+    response.raise_for_status()
+    return response.json()
+
+
+async def _apost_hedged(payload: dict, deadline: float) -> dict:
+    # Same policy as _post_hedged; losers are cancelled, so no slot is needed to bound them
+    attempt_timeout = _attempt_timeout(deadline)
+    task = asyncio.create_task(_apost_once(payload, attempt_timeout))
+    started = {task: time.monotonic()}
+    pending = {task}
+    hedges = 0
+
+    def create_hedge():
+        task = asyncio.create_task(_apost_once(payload, _attempt_timeout(deadline, OPEN_AI_HEDGE_READ_TIMEOUT)))
+        started[task] = time.monotonic()
+        return task
+
+    try:
+        if OPEN_AI_HEDGE_ENABLED:
+            done, pending = await asyncio.wait(pending, timeout=min(get_hedge_delay(), attempt_timeout))
+            if done:
+                pending = done
+            else:
+                pending.add(create_hedge())
+                hedges += 1
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(deadline - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    latency_tracker.record(time.monotonic() - started[task])
+                    return task.result()
+                error = task.exception()
+                if not is_retryable(error):
+                    raise error
+            if pending and hedges and hedges < OPEN_AI_MAX_HEDGES:
+                pending.add(create_hedge())
+                hedges += 1
+        raise error or TimeoutError('OpenAI request exceeded its deadline')
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def apost_chat_completion(payload: dict) -> dict:
+    deadline = time.monotonic() + OPEN_AI_TOTAL_TIMEOUT
+    error = None
+    for attempt in range(OPEN_AI_MAX_RETRIES + 1):
+        try:
+            return await _apost_hedged(payload, deadline)
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            error = e
+        retry_delay = get_retry_delay(attempt)
+        if attempt == OPEN_AI_MAX_RETRIES or time.monotonic() + retry_delay >= deadline:
+            break
+        await asyncio.sleep(retry_delay)
+
+    fallback_model = OPEN_AI_FALLBACK_MODELS.get(payload.get('model'))
+    if fallback_model:
+        return await _apost_hedged({**payload, 'model': fallback_model}, time.monotonic() + OPEN_AI_READ_TIMEOUT)
+    raise error
+
+
+async def aclose():
+    global _async_client, _async_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+    _async_loop = None
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+from schoolproj import settings
+
+# Bump when the grading prompt or function schema changes so old grades are not reused
+PROMPT_VERSION = 2
+
+GRADING_CACHE_BACKEND = getattr(settings, 'GRADING_CACHE_BACKEND', 'django')  # 'django', 'local' or None
+GRADING_CACHE_TTL = getattr(settings, 'GRADING_CACHE_TTL', 60 * 60 * 24)
+GRADING_CACHE_MAX_ENTRIES = getattr(settings, 'GRADING_CACHE_MAX_ENTRIES', 10000)
+
+
+def normalize_response(sanitized_response: str) -> str:
+    return re.sub(r'\s+', ' ', sanitized_response).strip().lower()
+
+
+def _digest(value) -> str:
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def make_grading_key(question_or_clone_id, is_clone, sanitized_response, criteria, gpt_model,
+                     question_details, student_goal) -> str:
+    """
+    Content-addressed key: question_details and student_goal are part of the digest,
+    so editing the question payload or TopicHandbook.goals produces a new key.
+    """
+    digest = _digest([
+        question_or_clone_id,
+        bool(is_clone),
+        normalize_response(sanitized_response),
+        criteria,
+        gpt_model,
+        PROMPT_VERSION,
+        question_details,
+        student_goal,
+    ])
+    return f'gpt_grade_{digest}'
+
+
+class LocalGradingCache:
+    """In-process LRU with per-entry TTL."""
+
+    def __init__(self, max_entries=GRADING_CACHE_MAX_ENTRIES, ttl=GRADING_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoGradingCache:
+    """Shared across workers; eviction is left to the configured Django cache (LRU in locmem/redis)."""
+
+    def __init__(self, ttl=GRADING_CACHE_TTL):
+        self.ttl = ttl
+
+    def get(self, key):
+        return cache.get(key)
+
+    def set(self, key, value):
+        cache.set(key, value, timeout=self.ttl)
+
+    def clear(self):
+        pass
+
+
+class GradingCacheStats:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+def _make_backend():
+    if GRADING_CACHE_BACKEND == 'django':
+        return DjangoGradingCache()
+    if GRADING_CACHE_BACKEND == 'local':
+        return LocalGradingCache()
+    return None
+
+
+grading_cache = _make_backend()
+grading_cache_stats = GradingCacheStats()
+
+
+def get_cached_grade(key):
+    if grading_cache is None:
+        return None
+    result = grading_cache.get(key)
+    grading_cache_stats.record(result is not None)
+    return result
+
+
+def set_cached_grade(key, result):
+    if grading_cache is not None:
+        grading_cache.set(key, dict(result))
@@ -0,0 +1,90 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from schoolproj import settings
+from training_test.models import Question, QuestionClone, TopicHandbook
+
+# Safety net for writes that skip the model signals, e.g. queryset.update()
+GRADING_CONTEXT_TTL = getattr(settings, 'GRADING_CONTEXT_TTL', 60 * 60)
+# Bumped whenever build_grading_context() adds or changes fields
+GRADING_CONTEXT_VERSION = 3
+
+Topic = TopicHandbook._meta.get_field('topic').related_model
+QuestionPayload = Question._meta.get_field('payload').related_model
+QuestionClonePayload = QuestionClone._meta.get_field('payload').related_model
+
+
+def grading_context_key(question_or_clone_id, is_clone) -> str:
+    kind = 'clone' if is_clone else 'question'
+    return f'grading_context_v{GRADING_CONTEXT_VERSION}_{kind}_{question_or_clone_id}'
+
+
+def get_cached_context(question_or_clone_id, is_clone):
+    return cache.get(grading_context_key(question_or_clone_id, is_clone))
+
+
+def get_cached_contexts(keys) -> dict:
+    cache_keys = {grading_context_key(question_or_clone_id, is_clone): (question_or_clone_id, is_clone)
+                  for question_or_clone_id, is_clone in keys}
+    cached = cache.get_many(list(cache_keys))
+    return {cache_keys[cache_key]: context for cache_key, context in cached.items()}
+
+
+def set_cached_context(question_or_clone_id, is_clone, context):
+    cache.set(grading_context_key(question_or_clone_id, is_clone), context, timeout=GRADING_CONTEXT_TTL)
+
+
+def set_cached_contexts(contexts: dict):
+    cache.set_many(
+        {grading_context_key(question_or_clone_id, is_clone): context
+         for (question_or_clone_id, is_clone), context in contexts.items()},
+        timeout=GRADING_CONTEXT_TTL
+    )
+
+
+def invalidate_questions(question_ids, clone_ids=()):
+    keys = [grading_context_key(question_id, False) for question_id in question_ids]
+    keys += [grading_context_key(clone_id, True) for clone_id in clone_ids]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_topic(topic_id):
+    question_ids = list(Question.objects.filter(test__topic_id=topic_id).values_list('id', flat=True))
+    clone_ids = list(QuestionClone.objects.filter(question__test__topic_id=topic_id).values_list('id', flat=True))
+    invalidate_questions(question_ids, clone_ids)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_question_context(sender, instance, **kwargs):
+    # Clone contexts carry the parent question's test and topic
+    clone_ids = list(QuestionClone.objects.filter(question_id=instance.id).values_list('id', flat=True))
+    invalidate_questions([instance.id], clone_ids)
+
+
+@receiver([post_save, post_delete], sender=QuestionClone)
+def invalidate_clone_context(sender, instance, **kwargs):
+    invalidate_questions([], [instance.id])
+
+
+@receiver([post_save, post_delete], sender=QuestionPayload)
+@receiver([post_save, post_delete], sender=QuestionClonePayload)
+def invalidate_payload_context(sender, instance, **kwargs):
+    # Criteria and question text live on the payload, so editing it in place must drop the contexts built from it
+    question_ids = []
+    clone_ids = []
+    if sender is QuestionPayload:
+        question_ids = list(Question.objects.filter(payload_id=instance.pk).values_list('id', flat=True))
+    if sender is QuestionClonePayload:
+        clone_ids = list(QuestionClone.objects.filter(payload_id=instance.pk).values_list('id', flat=True))
+    invalidate_questions(question_ids, clone_ids)
+
+
+@receiver([post_save, post_delete], sender=TopicHandbook)
+def invalidate_handbook_context(sender, instance, **kwargs):
+    invalidate_topic(instance.topic_id)
+
+
+@receiver([post_save, post_delete], sender=Topic)
+def invalidate_topic_context(sender, instance, **kwargs):
+    invalidate_topic(instance.id)
@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from schoolproj import settings
+
+# Names of sinks enabled at startup: 'logging', 'prometheus'. Empty list disables tracing entirely.
+GRADING_METRICS_SINKS = getattr(settings, 'GRADING_METRICS_SINKS', [])
+
+logger = logging.getLogger('grading.metrics')
+
+
+class _StageTimer:
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.stages[self.name] = self.trace.stages.get(self.name, 0.0) + time.perf_counter() - self.started
+        return False
+
+
+class GradingTrace:
+    """Stage timings and attributes of one grading; handed to every sink on finish()."""
+
+    enabled = True
+
+    def __init__(self, operation, sinks):
+        self.operation = operation
+        self.sinks = sinks
+        self.stages = {}
+        self.attributes = {}
+        self.started = time.perf_counter()
+        self.duration = None
+        self._token = None
+
+    def stage(self, name):
+        return _StageTimer(self, name)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_usage(self, response_data):
+        usage = response_data.get('usage') or {}
+        self.attributes['prompt_tokens'] = usage.get('prompt_tokens')
+        self.attributes['completion_tokens'] = usage.get('completion_tokens')
+
+    def finish(self, outcome='ok'):
+        self.duration = time.perf_counter() - self.started
+        self.attributes.setdefault('outcome', outcome)
+        if self._token is not None:
+            _current_trace.reset(self._token)
+            self._token = None
+        for sink in self.sinks:
+            try:
+                sink.emit(self)
+            except Exception:
+                logger.exception('Grading metrics sink %r failed', sink)
+
+    def as_dict(self):
+        return {
+            'operation': self.operation,
+            'duration': self.duration,
+            'stages': dict(self.stages),
+            **self.attributes,
+        }
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTrace:
+    """Returned when no sink is registered so the grading path pays almost nothing."""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def set(self, **attributes):
+        pass
+
+    def record_usage(self, response_data):
+        pass
+
+    def finish(self, outcome='ok'):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+_current_trace = ContextVar('grading_trace', default=NULL_TRACE)
+_sinks = []
+
+
+class LoggingSink:
+
+    def __init__(self, logger_name='grading.metrics', level=logging.INFO):
+        self.logger = logging.getLogger(logger_name)
+        self.level = level
+
+    def emit(self, trace):
+        self.logger.log(self.level, 'grading trace %s', trace.as_dict())
+
+
+class InMemorySink:
+    """Keeps finished traces in a list; meant for tests and local debugging."""
+
+    def __init__(self):
+        self.traces = []
+        self._lock = threading.Lock()
+
+    def emit(self, trace):
+        with self._lock:
+            self.traces.append(trace.as_dict())
+
+    def clear(self):
+        with self._lock:
+            self.traces.clear()
+
+
+class PrometheusTextSink:
+    """Aggregates traces in process and renders them in the Prometheus text exposition format."""
+
+    def __init__(self, prefix='grading'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.stage_seconds = defaultdict(float)
+        self.stage_count = defaultdict(int)
+        self.tokens = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+
+    def emit(self, trace):
+        attributes = trace.attributes
+        model = attributes.get('model', '')
+        lang = attributes.get('lang', '')
+        with self._lock:
+            self.requests[(trace.operation, model, lang, attributes.get('outcome', ''))] += 1
+            for stage, seconds in trace.stages.items():
+                self.stage_seconds[(trace.operation, stage)] += seconds
+                self.stage_count[(trace.operation, stage)] += 1
+            for kind in ('prompt_tokens', 'completion_tokens'):
+                if attributes.get(kind):
+                    self.tokens[(model, kind)] += attributes[kind]
+            for cache_name in ('context_cache_hit', 'grade_cache_hit'):
+                if cache_name in attributes:
+                    self.cache_hits[(cache_name, bool(attributes[cache_name]))] += 1
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = [f'# TYPE {p}_requests_total counter']
+        with self._lock:
+            for (operation, model, lang, outcome), value in sorted(self.requests.items()):
+                lines.append(f'{p}_requests_total{{operation="{operation}",model="{model}",lang="{lang}",outcome="{outcome}"}} {value}')
+            lines.append(f'# TYPE {p}_stage_seconds summary')
+            for (operation, stage), value in sorted(self.stage_seconds.items()):
+                lines.append(f'{p}_stage_seconds_sum{{operation="{operation}",stage="{stage}"}} {value:.6f}')
+                lines.append(f'{p}_stage_seconds_count{{operation="{operation}",stage="{stage}"}} {self.stage_count[(operation, stage)]}')
+            lines.append(f'# TYPE {p}_tokens_total counter')
+            for (model, kind), value in sorted(self.tokens.items()):
+                lines.append(f'{p}_tokens_total{{model="{model}",kind="{kind}"}} {value}')
+            lines.append(f'# TYPE {p}_cache_lookups_total counter')
+            for (cache_name, hit), value in sorted(self.cache_hits.items()):
+                lines.append(f'{p}_cache_lookups_total{{cache="{cache_name}",hit="{str(hit).lower()}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def add_sink(sink):
+    if sink not in _sinks:
+        _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def start_trace(operation='check_by_gpt', bind=True):
+    """
+    Starts a trace for one grading. With bind=True it also becomes current_trace() for the
+    helpers called below; generators pass bind=False since they resume in other contexts.
+    """
+    if not _sinks:
+        return NULL_TRACE
+    trace = GradingTrace(operation, list(_sinks))
+    if bind:
+        trace._token = _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+prometheus_sink = PrometheusTextSink()
+
+for _sink_name in GRADING_METRICS_SINKS:
+    if _sink_name == 'logging':
+        add_sink(LoggingSink())
+    elif _sink_name == 'prometheus':
+        add_sink(prometheus_sink)
@@ -0,0 +1,118 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.response import Response
+from handbook.utils.current_quarter import get_current_quarter
+from schoolproj import settings
+from training_test.models import SubjectLevel, Test
+from training_test.views.test.test_progress import bump_current_question_version
+
+# The quarter switches by date, so it is only cached for a short while
+CURRENT_QUARTER_TTL = getattr(settings, 'CURRENT_QUARTER_TTL', 60 * 5)
+TEST_SUBJECT_TTL = getattr(settings, 'TEST_SUBJECT_TTL', 60 * 60 * 24)
+STUDENT_LEVEL_TTL = getattr(settings, 'STUDENT_LEVEL_TTL', 60 * 60 * 24)
+
+CURRENT_QUARTER_KEY = 'current_quarter'
+
+_MISSING = object()
+
+
+def test_subject_key(test_id : int) -> str:
+    return f'test_{test_id}_subject_id'
+
+
+def student_level_key(student_id : int, subject_id : int, quarter_id : int) -> str:
+    return f'student_{student_id}_subject_{subject_id}_quarter_{quarter_id}_level'
+
+
+def get_cached_current_quarter():
+    quarter = cache.get(CURRENT_QUARTER_KEY, _MISSING)
+    if quarter is _MISSING:
+        # Holidays are cached as None too
+        quarter = get_current_quarter()
+        cache.set(CURRENT_QUARTER_KEY, quarter, timeout=CURRENT_QUARTER_TTL)
+    return quarter
+
+
+def get_test_subject_id(test_id : int) -> int | None:
+    key = test_subject_key(test_id)
+    subject_id = cache.get(key)
+    if subject_id is None:
+        subject_id = Test.objects.filter(id=test_id).values_list('topic__section__subject_id', flat=True).first()
+        if subject_id is not None:
+            cache.set(key, subject_id, timeout=TEST_SUBJECT_TTL)
+    return subject_id
+
+
+def _resolve_context(test_id : int):
+    quarter = get_cached_current_quarter()
+    if not quarter:
+        return Response({"detail": "Нет текущей четверти или каникулы"}, status=status.HTTP_404_NOT_FOUND)
+
+    subject_id = get_test_subject_id(test_id)
+    if subject_id is None:
+        return Response({'detail': 'Тест не найден'}, status=status.HTTP_404_NOT_FOUND)
+    return quarter, subject_id
+
+
+def _load_levels(student_ids, subject_id : int, quarter) -> dict:
+    levels = {student_id: None for student_id in student_ids}
+    subject_levels = SubjectLevel.objects.filter(
+        student_id__in=student_ids, quarter=quarter, subject_id=subject_id
+    ).select_related('level').order_by('pk')
+    found = set()
+    for subject_level in subject_levels:
+        # Same row as SubjectLevel.objects.filter(...).first() would return
+        if subject_level.student_id not in found:
+            found.add(subject_level.student_id)
+            levels[subject_level.student_id] = subject_level.level
+    return levels
+
+
+def resolve_level(test_id : int, student_id : int):
+    """
+    Level (Difficulty) of the student for the subject of the test in the current quarter.
+    Returns None when the student has no level and a Response when there is no quarter or test.
+    """
+    context = _resolve_context(test_id)
+    if isinstance(context, Response):
+        return context
+    quarter, subject_id = context
+
+    key = student_level_key(student_id, subject_id, quarter.id)
+    level = cache.get(key, _MISSING)
+    if level is _MISSING:
+        level = _load_levels([student_id], subject_id, quarter)[student_id]
+        cache.set(key, level, timeout=STUDENT_LEVEL_TTL)
+    return level
+
+
+def resolve_levels(student_ids, test_id : int):
+    """Bulk resolve_level for class-wide views: {student_id: level or None}, one query for the cache misses."""
+    context = _resolve_context(test_id)
+    if isinstance(context, Response):
+        return context
+    quarter, subject_id = context
+
+    keys = {student_level_key(student_id, subject_id, quarter.id): student_id for student_id in student_ids}
+    cached = cache.get_many(list(keys))
+    levels = {keys[key]: level for key, level in cached.items()}
+
+    missing_ids = [student_id for student_id in keys.values() if student_id not in levels]
+    if missing_ids:
+        loaded = _load_levels(missing_ids, subject_id, quarter)
+        cache.set_many(
+            {student_level_key(student_id, subject_id, quarter.id): level for student_id, level in loaded.items()},
+            timeout=STUDENT_LEVEL_TTL
+        )
+        levels.update(loaded)
+    return levels
+
+
+@receiver([post_save, post_delete], sender=SubjectLevel)
+def invalidate_student_level(sender, instance, **kwargs):
+    cache.delete(student_level_key(instance.student_id, instance.subject_id, instance.quarter_id))
+    # The cached current question was picked for the old level
+    for test_id in Test.objects.filter(topic__section__subject_id=instance.subject_id).values_list('id', flat=True):
+        bump_current_question_version(instance.student_id, test_id)
@@ -0,0 +1,171 @@
+"""
+Open-loop load generator for the grading path against the local fake OpenAI server.
+
+    # raw transport only, no Django models needed
+    python loadtest_grading.py --mode transport --rps 50 --duration 30 --latency lognormal:-1.2,0.5
+
+    # full check_by_gpt / clone generation, run with DJANGO_SETTINGS_MODULE pointing at the project
+    python loadtest_grading.py --mode grading --question-ids 12,13,14 --rps 20 --duration 60
+    python loadtest_grading.py --mode clones --question-ids 12 --rps 2 --duration 30
+
+Requests are scheduled at fixed intervals regardless of how long earlier ones take, and latency
+is measured from the scheduled start, so queueing in the worker pool shows up in the percentiles.
+"""
+import argparse
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fake_openai import FakeCompletionsServer
+
+TRANSPORT_PAYLOAD = {
+    'model': 'gpt-4o-mini',
+    'messages': [{'role': 'user', 'content': 'load test'}],
+    'function_call': {'name': 'evaluate_answer'},
+}
+
+
+class LoadStats:
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self, latency, ok):
+        with self._lock:
+            self.in_flight -= 1
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def make_target(mode, question_ids, unique_answers):
+    from training_test.views.question import gpt_transport
+
+    if mode == 'transport':
+        return lambda: gpt_transport.post_chat_completion(TRANSPORT_PAYLOAD)
+
+    import django
+    django.setup()
+    counter = itertools.count()
+
+    if mode == 'grading':
+        from training_test.views.question.gpt_check import check_by_gpt
+
+        def grade():
+            answer = f'Ответ ученика {next(counter)}' if unique_answers else 'Ответ ученика'
+            result = check_by_gpt(random.choice(question_ids), False, answer)
+            if not isinstance(result, dict):
+                raise RuntimeError(getattr(result, 'data', result))
+            return result
+        return grade
+
+    if mode == 'clones':
+        from training_test.views.question_clone.gpt_question import generate_gpt_question
+        return lambda: generate_gpt_question(random.choice(question_ids))
+
+    raise ValueError(f'Unknown mode: {mode}')
+
+
+def get_pool_usage():
+    from training_test.views.question import gpt_transport
+
+    adapter = gpt_transport.get_session().get_adapter(gpt_transport.CHAT_COMPLETIONS_URL)
+    pools = [adapter.poolmanager.pools[key] for key in adapter.poolmanager.pools.keys()]
+    return {
+        'pool_size': gpt_transport.OPEN_AI_POOL_SIZE,
+        'connections_opened': sum(pool.num_connections for pool in pools),
+        'requests_sent': sum(pool.num_requests for pool in pools),
+    }
+
+
+def run(target, rps, duration, workers):
+    stats = LoadStats()
+    total = int(rps * duration)
+    interval = 1 / rps
+
+    def call(scheduled_at):
+        stats.started()
+        ok = True
+        try:
+            target()
+        except Exception:
+            ok = False
+        stats.finished(time.perf_counter() - scheduled_at, ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index in range(total):
+            scheduled_at = started + index * interval
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(call, scheduled_at)
+    elapsed = time.perf_counter() - started
+    return stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['transport', 'grading', 'clones'], default='transport')
+    parser.add_argument('--rps', type=float, default=20)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=200)
+    parser.add_argument('--question-ids', default='')
+    parser.add_argument('--unique-answers', action='store_true', help='defeat the grading result cache')
+    parser.add_argument('--latency', default='lognormal:-1.2,0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--server-url', help='use an already running fake server instead of starting one')
+    args = parser.parse_args()
+
+    question_ids = [int(question_id) for question_id in args.question_ids.split(',') if question_id]
+    if args.mode != 'transport' and not question_ids:
+        parser.error('--question-ids is required for this mode')
+
+    import openai
+    from training_test.views.question import gpt_transport
+
+    server = None
+    if args.server_url:
+        base_url = args.server_url
+    else:
+        server = FakeCompletionsServer(latency=args.latency, error_rate=args.error_rate).start()
+        base_url = server.url
+    gpt_transport.CHAT_COMPLETIONS_URL = f'{base_url}/v1/chat/completions'
+    openai.api_base = f'{base_url}/v1'
+
+    try:
+        target = make_target(args.mode, question_ids, args.unique_answers)
+        stats, elapsed = run(target, args.rps, args.duration, args.workers)
+    finally:
+        if server is not None:
+            server.stop()
+
+    completed = len(stats.latencies)
+    print(f'mode={args.mode} target={args.rps:.1f} rps duration={elapsed:.1f}s')
+    print(f'completed={completed} errors={stats.errors} throughput={completed / elapsed:.1f} rps')
+    print('latency ms: ' + '  '.join(
+        f'p{int(fraction * 100)}={percentile(stats.latencies, fraction) * 1000:.1f}'
+        for fraction in (0.5, 0.9, 0.95, 0.99)
+    ) + f'  max={max(stats.latencies, default=0) * 1000:.1f}')
+    print(f'max in flight={stats.max_in_flight} pool={get_pool_usage()}')
+
+
+if __name__ == '__main__':
+    main()
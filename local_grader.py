@@ -0,0 +1,183 @@
+import re
+
+# Question types with a single right answer in the payload; these never need the LLM
+CLOSED_QUESTION_TYPES = ('single_choice', 'multiple_choice', 'matching', 'value_for_keys', 'blank', 'order')
+MAX_POINTS = 10
+
+# Kazakh letters are folded to the Russian letters students type instead on a Russian keyboard
+LETTER_VARIANTS = str.maketrans({
+    'ё': 'е', 'ә': 'а', 'ғ': 'г', 'қ': 'к', 'ң': 'н', 'ө': 'о', 'ұ': 'у', 'ү': 'у', 'һ': 'х', 'і': 'и',
+})
+WHITESPACE_RE = re.compile(r'\s+')
+EDGE_PUNCTUATION = ' .,;:!?"\'«»'
+
+
+def normalize_answer(value) -> str:
+    text = '' if value is None else str(value)
+    text = WHITESPACE_RE.sub(' ', text.casefold().translate(LETTER_VARIANTS))
+    return text.strip(EDGE_PUNCTUATION)
+
+
+def _alternatives(value) -> set:
+    # A blank or a matching pair may accept several spellings
+    if isinstance(value, (list, tuple, set)):
+        return {normalize_answer(item) for item in value}
+    return {normalize_answer(value)}
+
+
+def extract_answer_key(question_type : str, payload : dict | None):
+    """Correct answer from a serialized question payload, or None when the payload has none."""
+    if question_type not in CLOSED_QUESTION_TYPES or not payload:
+        return None
+
+    answer_key = payload.get('correct_answer')
+    if answer_key is None:
+        answer_key = payload.get('correct_answers')
+    if answer_key is None and question_type in ('single_choice', 'multiple_choice'):
+        correct_options = [option.get('text') for option in payload.get('options') or []
+                           if isinstance(option, dict) and option.get('is_correct')]
+        if correct_options:
+            answer_key = correct_options[0] if question_type == 'single_choice' else correct_options
+    return _check_answer_key(question_type, answer_key)
+
+
+def _is_scalar(value) -> bool:
+    return isinstance(value, (str, int, float))
+
+
+def _is_answer_value(value) -> bool:
+    # One accepted answer, or a list of accepted spellings of it
+    if isinstance(value, (list, tuple)):
+        return all(_is_scalar(item) for item in value)
+    return _is_scalar(value)
+
+
+def _check_answer_key(question_type : str, answer_key):
+    """
+    Answer key in the shape its scorer expects, or None when the teacher's data does not fit it,
+    so the question goes to the LLM instead of failing every student's answer.
+    """
+    if answer_key is None:
+        return None
+    if question_type in ('matching', 'value_for_keys'):
+        if isinstance(answer_key, dict) and all(_is_answer_value(value) for value in answer_key.values()):
+            return answer_key
+        return None
+    if question_type == 'single_choice':
+        return answer_key if _is_answer_value(answer_key) else None
+    # multiple_choice, blank and order: a lone value is a one-item list, not a string to iterate
+    if _is_scalar(answer_key):
+        answer_key = [answer_key]
+    # Only a blank may accept several spellings per item
+    is_item = _is_answer_value if question_type == 'blank' else _is_scalar
+    if isinstance(answer_key, (list, tuple)) and answer_key and all(is_item(item) for item in answer_key):
+        return list(answer_key)
+    return None
+
+
+def _score_single_choice(answer_key, student_response):
+    correct = normalize_answer(student_response) in _alternatives(answer_key)
+    return int(correct), 1
+
+
+def _score_multiple_choice(answer_key, student_response):
+    # Each right option earns a share, each wrong one takes a share back; never below zero
+    correct = {normalize_answer(item) for item in answer_key}
+    chosen = {normalize_answer(item) for item in student_response or []}
+    return max(len(chosen & correct) - len(chosen - correct), 0), len(correct)
+
+
+def _score_pairs(answer_key, student_response):
+    student_pairs = {normalize_answer(key): value for key, value in (student_response or {}).items()}
+    right = sum(
+        1 for key, value in answer_key.items()
+        if normalize_answer(student_pairs.get(normalize_answer(key))) in _alternatives(value)
+    )
+    return right, len(answer_key)
+
+
+def _score_blank(answer_key, student_response):
+    student_response = list(student_response or [])
+    right = sum(
+        1 for index, value in enumerate(answer_key)
+        if index < len(student_response) and normalize_answer(student_response[index]) in _alternatives(value)
+    )
+    return right, len(answer_key)
+
+
+def _score_order(answer_key, student_response):
+    # Longest run kept in the right relative order, so one misplaced item costs one share, not all after it
+    expected = [normalize_answer(item) for item in answer_key]
+    given = [normalize_answer(item) for item in student_response or []]
+    lengths = [0] * (len(given) + 1)
+    for item in expected:
+        previous = 0
+        for index, given_item in enumerate(given, 1):
+            current = lengths[index]
+            lengths[index] = previous + 1 if item == given_item else max(lengths[index], lengths[index - 1])
+            previous = current
+    # Extra or repeated items count against the answer, otherwise repeating the items would max any question
+    return lengths[-1], max(len(expected), len(given))
+
+
+# Shape of the student's answer each type expects, as get_empty_student_response creates it
+RESPONSE_TYPES = {
+    'single_choice': (str, int, float),
+    'multiple_choice': (list, tuple),
+    'matching': dict,
+    'value_for_keys': dict,
+    'blank': (list, tuple),
+    'order': (list, tuple),
+}
+
+SCORERS = {
+    'single_choice': _score_single_choice,
+    'multiple_choice': _score_multiple_choice,
+    'matching': _score_pairs,
+    'value_for_keys': _score_pairs,
+    'blank': _score_blank,
+    'order': _score_order,
+}
+
+
+def grade_closed_answer(question_type : str, answer_key, student_response) -> dict:
+    """
+    Grades a closed question the way check_by_gpt reports open ones:
+    {'points': 0..10, 'criteria_evaluation': str, 'moderation_flag': False}.
+    """
+    if answer_key is None:
+        raise ValueError('У вопроса нет правильного ответа')
+    if student_response is not None and not isinstance(student_response, RESPONSE_TYPES[question_type]):
+        raise TypeError(f'Неверный формат ответа для вопроса типа {question_type}')
+
+    try:
+        right, total = SCORERS[question_type](answer_key, student_response)
+    except (TypeError, AttributeError):
+        # Answer key or response items of an unexpected shape
+        raise TypeError(f'Неверный формат ответа для вопроса типа {question_type}')
+    points = round(MAX_POINTS * right / total, 1) if total else 0.0
+    return {
+        'points': points,
+        'criteria_evaluation': f'### Ответ оценен на {points:g} из {MAX_POINTS} баллов\n\nВерно: {right} из {total}.',
+        'moderation_flag': False,
+    }
+
+
+def grade_submission(answer_keys : dict, responses : dict) -> dict:
+    """
+    Scores a whole test submission in one pass.
+    `answer_keys` maps question id to (question_type, answer_key), `responses` maps it to the student's answer;
+    unanswered questions score zero.
+    """
+    results = {}
+    for question_id, (question_type, answer_key) in answer_keys.items():
+        try:
+            results[question_id] = grade_closed_answer(question_type, answer_key, responses.get(question_id))
+        except (ValueError, TypeError, AttributeError) as e:
+            results[question_id] = {'points': 0.0, 'criteria_evaluation': '', 'moderation_flag': False, 'error': str(e)}
+
+    return {
+        'results': results,
+        'points': sum(result['points'] for result in results.values()),
+        'max_points': MAX_POINTS * len(results),
+    }
@@ -8,7 +8,7 @@ class Resume(Base):
     __tablename__ = "resumes"
 
     id = Column(Integer, autoincrement=True, unique=True)  # Unique auto-incrementing ID
-    resume_id = Column(String, primary_key=True, unique=True, nullable=False)  # String primary key
+    resume_id = Column(String, primary_key=True, nullable=False)  # String primary key
     last_name = Column(String, nullable=False)
     first_name = Column(String, nullable=False)
     middle_name = Column(String)
@@ -22,7 +22,7 @@ class Resume(Base):
     resume_url = Column(String)
     platform_name = Column(String)
     response_date = Column(Date)
-    vacancy_id = Column(Integer, ForeignKey("vacancies.vacancy_id"), nullable=False)
+    vacancy_id = Column(Integer, ForeignKey("vacancies.vacancy_id"), nullable=False, index=True)
 
     # Relationships
     education = relationship("Education", back_populates="resume")
@@ -41,8 +41,8 @@ class Language(Base):
     __tablename__ = "languages"
 
     id = Column(Integer, autoincrement=True, unique=True)  # Unique auto-incrementing ID
-    language_id = Column(String, primary_key=True, unique=True, nullable=False)  # String primary key
-    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False)
+    language_id = Column(String, primary_key=True, nullable=False)  # String primary key
+    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False, index=True)
     language_name = Column(String, nullable=False)
     language_level_id = Column(String)
     language_level_name = Column(String)
@@ -56,8 +56,8 @@ class Citizenship(Base):
     __tablename__ = "citizenship"
 
     id = Column(Integer, autoincrement=True, unique=True)  # Unique auto-incrementing ID
-    citizenship_id = Column(String, primary_key=True, unique=True, nullable=False)  # String primary key
-    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False)
+    citizenship_id = Column(String, primary_key=True, nullable=False)  # String primary key
+    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False, index=True)
     country_id = Column(String)
     country_name = Column(String)
 
@@ -70,8 +70,8 @@ class Certificate(Base):
     __tablename__ = "certificates"
 
     id = Column(Integer, autoincrement=True, unique=True)
-    certificate_id = Column(String, primary_key=True, unique=True, nullable=False)
-    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False)
+    certificate_id = Column(String, primary_key=True, nullable=False)
+    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False, index=True)
     certificate_title = Column(String, nullable=False)
     certificate_url = Column(String)
     achieved_at = Column(Date)
@@ -86,8 +86,8 @@ class Education(Base):
     __tablename__ = "education"
 
     id = Column(Integer, autoincrement=True, unique=True)  # Unique auto-incrementing ID
-    education_id = Column(String, primary_key=True, unique=True, nullable=False)  # String primary key
-    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False)
+    education_id = Column(String, primary_key=True, nullable=False)  # String primary key
+    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False, index=True)
     level = Column(String)
     name = Column(String)
     organization = Column(String)
@@ -103,8 +103,8 @@ class Experience(Base):
     __tablename__ = "experience"
 
     id = Column(Integer, autoincrement=True, unique=True)  # Unique auto-incrementing ID
-    experience_id = Column(String, primary_key=True, unique=True, nullable=False)  # String primary key
-    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False)
+    experience_id = Column(String, primary_key=True, nullable=False)  # String primary key
+    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False, index=True)
     start_date = Column(Date)
     end_date = Column(Date)
     company = Column(String)
@@ -120,8 +120,8 @@ class Skill(Base):
     __tablename__ = "skills"
 
     id = Column(Integer, autoincrement=True, unique=True)  # Unique auto-incrementing ID
-    skill_id = Column(String, primary_key=True, unique=True, nullable=False)  # String primary key
-    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False)
+    skill_id = Column(String, primary_key=True, nullable=False)  # String primary key
+    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False, index=True)
     skill_name = Column(String, nullable=False)
 
     # Relationship
@@ -133,8 +133,8 @@ class Contact(Base):
     __tablename__ = "contacts"
 
     id = Column(Integer, autoincrement=True, unique=True)  # Unique auto-incrementing ID
-    contact_id = Column(String, primary_key=True, unique=True, nullable=False)  # String primary key
-    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False)
+    contact_id = Column(String, primary_key=True, nullable=False)  # String primary key
+    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False, index=True)
     contact_type = Column(String)
     contact_info = Column(String)
     preferred = Column(String)
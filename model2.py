@@ -7,7 +7,7 @@ from config.shared_base import Base
 class Vacancy(Base):
     __tablename__ = "vacancies"
     id = Column(Integer, unique=True, autoincrement=True)
-    vacancy_id = Column(String, primary_key=True, unique=True, nullable=False)
+    vacancy_id = Column(String, primary_key=True, nullable=False)
     description = Column(Text, nullable=False)
     responses = Column(Integer, default=0)
     active = Column(Boolean, default=False)
@@ -1,20 +1,86 @@
-from sqlalchemy import Column, Integer, String, JSON, ForeignKey
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, JSON, ForeignKey, Index, Float, DateTime, event
 from sqlalchemy.orm import relationship
 
 from config.shared_base import Base
 
+# Keys the scanner has used for the scoring fields inside candidate_data, most specific first
+SCORE_KEYS = ("overall_score", "total_score", "score", "match_score")
+VERDICT_KEYS = ("verdict", "decision", "recommendation")
+SCANNED_AT_KEYS = ("scanned_at", "scan_date", "created_at")
+
 
 class ScanResult(Base):
     __tablename__ = "scan_results"
+    __table_args__ = (
+        # One scan per candidate and vacancy; also serves lookups by vacancy_id alone
+        Index("uq_scan_results_vacancy_resume", "vacancy_id", "resume_id", unique=True),
+        # Top-K candidates of a vacancy straight from the index
+        Index("ix_scan_results_vacancy_score", "vacancy_id", "overall_score"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     vacancy_id = Column(String, ForeignKey("vacancies.vacancy_id"), nullable=False)
-    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False)
+    resume_id = Column(String, ForeignKey("resumes.resume_id"), nullable=False, index=True)
     candidate_data = Column(JSON, nullable=False)
 
+    # Copied out of candidate_data on every write (see set_scan_scores)
+    overall_score = Column(Float)
+    verdict = Column(String, index=True)
+    scanned_at = Column(DateTime, index=True)
+
     # Relationships
     vacancy = relationship("Vacancy", back_populates="scan_results")
     resume = relationship("Resume", back_populates="scan_results")
 
     def __repr__(self):
         return f"<ScanResult(id={self.id}, vacancy_id={self.vacancy_id}, resume_id={self.resume_id})>"
+
+
+def _first(candidate_data, keys):
+    for key in keys:
+        if candidate_data.get(key) not in (None, ""):
+            return candidate_data[key]
+    return None
+
+
+def _parse_score(value):
+    if isinstance(value, str):
+        value = value.strip().rstrip("%").replace(",", ".")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_datetime(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    # Stored as naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def extract_scan_scores(candidate_data) -> dict:
+    """Typed overall_score / verdict / scanned_at values for a candidate_data document."""
+    candidate_data = candidate_data if isinstance(candidate_data, dict) else {}
+    verdict = _first(candidate_data, VERDICT_KEYS)
+    return {
+        "overall_score": _parse_score(_first(candidate_data, SCORE_KEYS)),
+        "verdict": str(verdict).strip().lower() if verdict is not None else None,
+        "scanned_at": _parse_datetime(_first(candidate_data, SCANNED_AT_KEYS)),
+    }
+
+
+@event.listens_for(ScanResult, "before_insert")
+@event.listens_for(ScanResult, "before_update")
+def set_scan_scores(mapper, connection, target):
+    scores = extract_scan_scores(target.candidate_data)
+    target.overall_score = scores["overall_score"]
+    target.verdict = scores["verdict"]
+    # Without a timestamp in the document the time of the first write is kept
+    target.scanned_at = scores["scanned_at"] or target.scanned_at or datetime.now(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,83 @@
+import functools
+import json
+from schoolproj import settings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+GPT_PROMPT_TOKEN_BUDGET = getattr(settings, 'GPT_PROMPT_TOKEN_BUDGET', 1500)
+
+# Bookkeeping fields that carry no meaning for grading; criteria are sent in the system message
+NOISE_FIELDS = {'id', 'created_at', 'updated_at', 'is_active', 'order', 'image', 'criteria'}
+MIN_STRING_LENGTH = 32
+TRUNCATION_MARK = '…'
+
+@functools.cache
+def _get_encoding():
+    # Loaded on first use: the BPE file may have to be downloaded, which must not happen at import time
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding('o200k_base')
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # ~4 bytes per token holds reasonably for both Latin and Cyrillic text
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+def _is_noise(key):
+    return key in NOISE_FIELDS or key.endswith('_id')
+
+
+def _compact(value, max_string_length=None):
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if _is_noise(key):
+                continue
+            item = _compact(item, max_string_length)
+            if item in (None, '', [], {}):
+                continue
+            compacted[key] = item
+        return compacted
+    if isinstance(value, (list, tuple)):
+        return [item for item in (_compact(item, max_string_length) for item in value) if item not in (None, '', [], {})]
+    if isinstance(value, str):
+        value = value.strip()
+        if max_string_length and len(value) > max_string_length:
+            return value[:max_string_length] + TRUNCATION_MARK
+    return value
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def serialize_question_for_prompt(question_details, token_budget: int | None = None) -> str:
+    """
+    Compact, stable JSON of the grading-relevant part of a serialized question.
+    Long strings are shortened until the text fits into `token_budget`.
+    """
+    token_budget = token_budget or GPT_PROMPT_TOKEN_BUDGET
+    text = _dumps(_compact(question_details))
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    max_string_length = max(len(text) // 2, MIN_STRING_LENGTH)
+    while max_string_length > MIN_STRING_LENGTH:
+        text = _dumps(_compact(question_details, max_string_length))
+        if estimate_tokens(text) <= token_budget:
+            return text
+        max_string_length //= 2
+
+    # Still over budget with every string at the minimum: cut the text itself
+    max_chars = token_budget * 2
+    return text[:max_chars] + TRUNCATION_MARK if len(text) > max_chars else text
@@ -0,0 +1,226 @@
+"""
+Streaming importer for platform resume feeds (JSON Lines, optionally gzipped).
+
+    python resume_importer.py responses.jsonl --database-url postgresql://... --chunk-size 500
+
+Each line is one resume: the Resume columns plus child lists under the relationship names
+(education, experience, skills, contacts, languages, citizenship, certificates, scan_results).
+Resumes and their children are upserted on their string primary keys and scan results on
+(vacancy_id, resume_id), one transaction per chunk, so memory stays bounded by the chunk size
+whatever the size of the feed.
+"""
+import argparse
+import gzip
+import json
+import logging
+import time
+from datetime import date, datetime, timezone
+from itertools import islice
+from sqlalchemy import Date, create_engine, func, update
+from model1 import Certificate, Citizenship, Contact, Education, Experience, Language, Resume, Skill
+from model3 import ScanResult, extract_scan_scores
+
+logger = logging.getLogger('resume_importer')
+
+DEFAULT_CHUNK_SIZE = 500
+# Scans are upserted on the uq_scan_results_vacancy_resume unique index, so re-importing a feed is idempotent
+SCAN_RESULT_KEY = ('vacancy_id', 'resume_id')
+
+# Relationship name in the feed -> child model, in insert order
+CHILD_MODELS = {
+    'education': Education,
+    'experience': Experience,
+    'skills': Skill,
+    'contacts': Contact,
+    'languages': Language,
+    'citizenship': Citizenship,
+    'certificates': Certificate,
+}
+
+
+class ImportStats:
+
+    def __init__(self):
+        self.resumes = 0
+        self.rows = 0
+        self.skipped_lines = 0
+        self.invalid_values = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f'resumes={self.resumes} rows={self.rows} chunks={self.chunks} skipped_lines={self.skipped_lines} '
+                f'invalid_values={self.invalid_values} '
+                f'elapsed={self.elapsed:.1f}s rows/s={self.rows_per_second:.0f}')
+
+
+def iter_feed(path : str, stats : ImportStats | None = None):
+    """Yields resume dicts one line at a time; malformed lines are logged and skipped."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as feed:
+        for line_number, line in enumerate(feed, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning('Skipping malformed line %s', line_number)
+                if stats is not None:
+                    stats.skipped_lines += 1
+
+
+def iter_chunks(iterable, size : int):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _primary_key(model) -> str:
+    return list(model.__table__.primary_key.columns)[0].name
+
+
+def _insert_columns(model) -> list:
+    # The surrogate integer id is left to the database
+    return [column for column in model.__table__.columns if column.name != 'id']
+
+
+def _parse_date(value : str, column, stats : ImportStats | None = None):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        # One unparseable date must not abort the whole chunk; the row is kept without it
+        logger.warning('Skipping unparseable %s.%s value %r', column.table.name, column.name, value)
+        if stats is not None:
+            stats.invalid_values += 1
+        return None
+
+
+def _to_row(columns, data : dict, stats : ImportStats | None = None, **overrides) -> dict:
+    row = {}
+    for column in columns:
+        value = overrides.get(column.name, data.get(column.name))
+        if isinstance(value, str) and isinstance(column.type, Date):
+            value = _parse_date(value, column, stats)
+        row[column.name] = value
+    return row
+
+
+def _conflict_columns(model) -> list:
+    if model is ScanResult:
+        return list(SCAN_RESULT_KEY)
+    return [_primary_key(model)]
+
+
+def upsert_statement(connection, model):
+    """INSERT ... ON CONFLICT (key) DO UPDATE for the connection's dialect."""
+    table = model.__table__
+    conflict_columns = _conflict_columns(model)
+    updated = [column.name for column in _insert_columns(model) if column.name not in conflict_columns]
+    dialect = connection.dialect.name
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(table)
+        return statement.on_duplicate_key_update(_update_values(model, table, statement.inserted, updated))
+    else:
+        raise NotImplementedError(f'Upsert is not supported for {dialect}')
+
+    statement = dialect_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=conflict_columns,
+        set_=_update_values(model, table, statement.excluded, updated),
+    )
+
+
+def _update_values(model, table, incoming, updated : list) -> dict:
+    values = {name: incoming[name] for name in updated}
+    if model is ScanResult:
+        # A re-imported document without its own timestamp keeps the stored scan time, like the ORM listener
+        values['scanned_at'] = func.coalesce(incoming['scanned_at'], table.c.scanned_at)
+    return values
+
+
+def _dedupe(rows : list, conflict_columns : list) -> list:
+    # One statement may not touch the same row twice; the last occurrence in the feed wins
+    return list({tuple(row[name] for name in conflict_columns): row for row in rows}.values())
+
+
+def import_chunk(connection, resumes : list, stats : ImportStats | None = None) -> int:
+    resume_columns = _insert_columns(Resume)
+    resume_rows = [_to_row(resume_columns, resume, stats) for resume in resumes]
+    child_rows = {model: [] for model in CHILD_MODELS.values()}
+    scan_rows = []
+    scan_columns = _insert_columns(ScanResult)
+
+    for resume in resumes:
+        resume_id = resume['resume_id']
+        for name, model in CHILD_MODELS.items():
+            columns = _insert_columns(model)
+            child_rows[model].extend(_to_row(columns, child, stats, resume_id=resume_id) for child in resume.get(name) or [])
+        for scan in resume.get('scan_results') or []:
+            # Core inserts skip the ORM listener that fills the score columns
+            scores = extract_scan_scores(scan.get('candidate_data'))
+            scan_rows.append(_to_row(
+                scan_columns, scan, stats, resume_id=resume_id, vacancy_id=scan.get('vacancy_id', resume.get('vacancy_id')),
+                **scores
+            ))
+
+    rows = 0
+    for model, model_rows in [(Resume, resume_rows), *child_rows.items(), (ScanResult, scan_rows)]:
+        if not model_rows:
+            continue
+        model_rows = _dedupe(model_rows, _conflict_columns(model))
+        connection.execute(upsert_statement(connection, model), model_rows)
+        rows += len(model_rows)
+    if scan_rows:
+        # New scans without a document timestamp are stamped with the import time
+        connection.execute(
+            update(ScanResult.__table__).where(ScanResult.__table__.c.scanned_at.is_(None))
+            .values(scanned_at=datetime.now(timezone.utc).replace(tzinfo=None))
+        )
+    return rows
+
+
+def import_resumes(engine, resumes, chunk_size : int = DEFAULT_CHUNK_SIZE, stats : ImportStats | None = None) -> ImportStats:
+    """Imports an iterable of resume dicts, committing once per chunk."""
+    stats = stats or ImportStats()
+    for chunk in iter_chunks(resumes, chunk_size):
+        with engine.begin() as connection:
+            stats.rows += import_chunk(connection, chunk, stats)
+        stats.resumes += len(chunk)
+        stats.chunks += 1
+        logger.info('%s', stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='JSON Lines feed, .gz is decompressed on the fly')
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    engine = create_engine(args.database_url)
+    stats = ImportStats()
+    import_resumes(engine, iter_feed(args.path, stats), args.chunk_size, stats)
+    print(stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Cheap first-stage ranking of a vacancy's candidates before the expensive scan.
+
+Resumes are scored with BM25 against the vacancy description: the description's terms are the query,
+the vacancy's candidates are the corpus. Term counts are cached per resume and per vacancy for a few
+minutes (see resume_terms), so repeated rankings only load and tokenize resumes missing from the cache;
+the scoring itself is a handful of NumPy/SciPy operations over a candidates x query-terms matrix.
+"""
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from model1 import Resume
+from model3 import ScanResult
+from resume_repository import ResumeRepository
+from resume_terms import resume_terms, resume_terms_cache, tokenize, vacancy_terms_cache
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def get_vacancy_terms(session, vacancy_id : str):
+    cached = vacancy_terms_cache.get_many([vacancy_id])
+    if vacancy_id in cached:
+        return cached[vacancy_id]
+
+    description = ResumeRepository(session).get_vacancy_description(vacancy_id)
+    if description is None:
+        return None
+    terms = Counter(tokenize(description))
+    vacancy_terms_cache.set(vacancy_id, terms)
+    return terms
+
+
+def get_resume_terms(session, resume_ids) -> dict:
+    terms = resume_terms_cache.get_many(resume_ids)
+    missing_ids = [resume_id for resume_id in resume_ids if resume_id not in terms]
+    for resume in ResumeRepository(session).get_many(missing_ids, profile='scan-input'):
+        terms[resume.resume_id] = resume_terms(resume)
+        resume_terms_cache.set(resume.resume_id, terms[resume.resume_id])
+    return terms
+
+
+def bm25_scores(query_terms : dict, documents : list, k1 : float = BM25_K1, b : float = BM25_B) -> np.ndarray:
+    """BM25 score of every document (a term -> count mapping) for the query, as one vector."""
+    if not documents:
+        return np.zeros(0)
+
+    vocabulary = {term: column for column, term in enumerate(query_terms)}
+    rows, columns, counts = [], [], []
+    lengths = np.empty(len(documents), dtype=np.float64)
+    for row, document in enumerate(documents):
+        lengths[row] = sum(document.values())
+        for term, count in document.items():
+            column = vocabulary.get(term)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+                counts.append(count)
+
+    tf = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float64), (rows, columns)), shape=(len(documents), len(vocabulary))
+    )
+    if not tf.nnz:
+        return np.zeros(len(documents))
+
+    document_frequency = np.bincount(tf.indices, minlength=len(vocabulary))
+    idf = np.log1p((len(documents) - document_frequency + 0.5) / (document_frequency + 0.5))
+    query_weights = np.fromiter(query_terms.values(), dtype=np.float64, count=len(vocabulary))
+
+    average_length = lengths.mean() or 1.0
+    row_of_value = np.repeat(np.arange(len(documents)), np.diff(tf.indptr))
+    norms = k1 * (1 - b + b * lengths[row_of_value] / average_length)
+    tf.data = tf.data * (k1 + 1) / (tf.data + norms)
+    return tf @ (idf * query_weights)
+
+
+def rank_candidates(session, vacancy_id : str) -> list:
+    """[(resume_id, score)] of all candidates of the vacancy, best first."""
+    query_terms = get_vacancy_terms(session, vacancy_id)
+    if not query_terms:
+        return []
+
+    resume_ids = session.execute(select(Resume.resume_id).where(Resume.vacancy_id == vacancy_id)).scalars().all()
+    terms = get_resume_terms(session, resume_ids)
+    resume_ids = [resume_id for resume_id in resume_ids if resume_id in terms]
+
+    scores = bm25_scores(query_terms, [terms[resume_id] for resume_id in resume_ids])
+    order = np.argsort(-scores, kind='stable')
+    return [(resume_ids[index], float(scores[index])) for index in order]
+
+
+def preselect_for_scan(session, vacancy_id : str, top_n : int | None = None, threshold : float | None = None,
+                       skip_scanned : bool = True) -> list:
+    """
+    Candidates worth the expensive scan: the best `top_n`, and/or those whose score is at least
+    `threshold` of the best one (0..1, BM25 scores are not comparable across vacancies).
+    Resumes already scanned for the vacancy are left out unless skip_scanned is False.
+    """
+    ranked = rank_candidates(session, vacancy_id)
+    if skip_scanned:
+        scanned = set(session.execute(
+            select(ScanResult.resume_id).where(ScanResult.vacancy_id == vacancy_id)
+        ).scalars())
+        ranked = [(resume_id, score) for resume_id, score in ranked if resume_id not in scanned]
+
+    if threshold is not None and ranked:
+        best = ranked[0][1]
+        ranked = [(resume_id, score) for resume_id, score in ranked if best and score >= threshold * best]
+    if top_n is not None:
+        ranked = ranked[:top_n]
+    return ranked
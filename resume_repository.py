@@ -0,0 +1,241 @@
+from dataclasses import dataclass, fields
+from datetime import date, datetime
+from sqlalchemy import select
+from sqlalchemy.orm import raiseload, selectinload
+from model1 import Resume
+from model2 import Vacancy
+from model3 import ScanResult
+
+
+@dataclass(slots=True, frozen=True)
+class EducationDTO:
+    education_id: str
+    level: str | None
+    name: str | None
+    organization: str | None
+    result: str | None
+    year: int | None
+
+
+@dataclass(slots=True, frozen=True)
+class ExperienceDTO:
+    experience_id: str
+    start_date: date | None
+    end_date: date | None
+    company: str | None
+    position: str | None
+    description: str | None
+
+
+@dataclass(slots=True, frozen=True)
+class ContactDTO:
+    contact_id: str
+    contact_type: str | None
+    contact_info: str | None
+    preferred: str | None
+
+
+@dataclass(slots=True, frozen=True)
+class LanguageDTO:
+    language_id: str
+    language_name: str
+    language_level_id: str | None
+    language_level_name: str | None
+
+
+@dataclass(slots=True, frozen=True)
+class CitizenshipDTO:
+    citizenship_id: str
+    country_id: str | None
+    country_name: str | None
+
+
+@dataclass(slots=True, frozen=True)
+class CertificateDTO:
+    certificate_id: str
+    certificate_title: str
+    certificate_url: str | None
+    achieved_at: date | None
+
+
+@dataclass(slots=True, frozen=True)
+class ScanResultDTO:
+    id: int
+    vacancy_id: str
+    candidate_data: dict
+
+
+@dataclass(slots=True, frozen=True)
+class ResumeCardDTO:
+    """What a candidate card in the vacancy list shows."""
+    resume_id: str
+    last_name: str
+    first_name: str
+    middle_name: str | None
+    title: str | None
+    age: int | None
+    salary_amount: float | None
+    salary_currency: str | None
+    total_experience_months: int | None
+    platform_name: str | None
+    response_date: date | None
+    skills: tuple[str, ...]
+    contacts: tuple[ContactDTO, ...]
+    languages: tuple[LanguageDTO, ...]
+    scan_results: tuple[ScanResultDTO, ...]
+
+
+@dataclass(slots=True, frozen=True)
+class ResumeDTO:
+    resume_id: str
+    last_name: str
+    first_name: str
+    middle_name: str | None
+    title: str | None
+    age: int | None
+    salary_amount: float | None
+    salary_currency: str | None
+    total_experience_months: int | None
+    birth_date: date | None
+    driver_license_types: str | None
+    resume_url: str | None
+    platform_name: str | None
+    response_date: date | None
+    vacancy_id: str
+    skills: tuple[str, ...]
+    education: tuple[EducationDTO, ...]
+    experience: tuple[ExperienceDTO, ...]
+    contacts: tuple[ContactDTO, ...]
+    languages: tuple[LanguageDTO, ...]
+    citizenship: tuple[CitizenshipDTO, ...]
+    certificates: tuple[CertificateDTO, ...]
+    scan_results: tuple[ScanResultDTO, ...]
+
+
+@dataclass(slots=True, frozen=True)
+class ScanInputDTO:
+    """The parts of a resume that go into a scan against the vacancy description."""
+    resume_id: str
+    title: str | None
+    total_experience_months: int | None
+    skills: tuple[str, ...]
+    education: tuple[EducationDTO, ...]
+    experience: tuple[ExperienceDTO, ...]
+    languages: tuple[LanguageDTO, ...]
+    certificates: tuple[CertificateDTO, ...]
+
+
+@dataclass(slots=True, frozen=True)
+class ScoredCandidateDTO:
+    scan_id: int
+    resume_id: str
+    overall_score: float | None
+    verdict: str | None
+    scanned_at: datetime | None
+
+
+CHILD_DTOS = {
+    'education': EducationDTO,
+    'experience': ExperienceDTO,
+    'contacts': ContactDTO,
+    'languages': LanguageDTO,
+    'citizenship': CitizenshipDTO,
+    'certificates': CertificateDTO,
+    'scan_results': ScanResultDTO,
+}
+
+# Loading profile -> (resume DTO, relationships loaded with one SELECT ... IN each)
+PROFILES = {
+    'card': (ResumeCardDTO, ('skills', 'contacts', 'languages', 'scan_results')),
+    'full': (ResumeDTO, ('skills', 'education', 'experience', 'contacts', 'languages', 'citizenship',
+                         'certificates', 'scan_results')),
+    'scan-input': (ScanInputDTO, ('skills', 'education', 'experience', 'languages', 'certificates')),
+}
+
+
+def _to_dto(dto_class, instance):
+    return dto_class(**{field.name: getattr(instance, field.name) for field in fields(dto_class)})
+
+
+def _resume_to_dto(dto_class, resume):
+    values = {}
+    for field in fields(dto_class):
+        if field.name == 'skills':
+            values['skills'] = tuple(skill.skill_name for skill in resume.skills)
+        elif field.name in CHILD_DTOS:
+            child_dto = CHILD_DTOS[field.name]
+            values[field.name] = tuple(_to_dto(child_dto, child) for child in getattr(resume, field.name))
+        else:
+            values[field.name] = getattr(resume, field.name)
+    return dto_class(**values)
+
+
+class ResumeRepository:
+    """
+    Read access to resumes as plain DTOs. Each profile loads its relationships with selectinload,
+    so a page of resumes costs one query plus one per relationship of the profile, whatever its size.
+    Everything else is raiseload'ed: touching an unloaded relationship fails instead of firing a query.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def _select(self, profile : str):
+        dto_class, relationships = PROFILES[profile]
+        options = [selectinload(getattr(Resume, name)) for name in relationships]
+        return dto_class, select(Resume).options(*options, raiseload('*'))
+
+    def _fetch(self, profile : str, statement_filter) -> list:
+        dto_class, statement = self._select(profile)
+        resumes = self.session.execute(statement_filter(statement)).scalars().all()
+        return [_resume_to_dto(dto_class, resume) for resume in resumes]
+
+    def get(self, resume_id : str, profile : str = 'full'):
+        resumes = self._fetch(profile, lambda statement: statement.where(Resume.resume_id == resume_id))
+        return resumes[0] if resumes else None
+
+    def get_many(self, resume_ids, profile : str = 'full') -> list:
+        resume_ids = list(resume_ids)
+        if not resume_ids:
+            return []
+        return self._fetch(
+            profile,
+            lambda statement: statement.where(Resume.resume_id.in_(resume_ids)).order_by(Resume.resume_id)
+        )
+
+    def list_for_vacancy(self, vacancy_id : str, profile : str = 'card', limit : int | None = None, offset : int = 0) -> list:
+        def statement_filter(statement):
+            statement = statement.where(Resume.vacancy_id == vacancy_id).order_by(
+                Resume.response_date.desc(), Resume.resume_id
+            ).offset(offset)
+            return statement.limit(limit) if limit is not None else statement
+        return self._fetch(profile, statement_filter)
+
+    def get_vacancy_description(self, vacancy_id : str) -> str | None:
+        return self.session.execute(
+            select(Vacancy.description).where(Vacancy.vacancy_id == vacancy_id)
+        ).scalar_one_or_none()
+
+    def top_candidates(self, vacancy_id : str, k : int = 10, filters : dict | None = None, offset : int = 0) -> list:
+        """
+        Best scored candidates of a vacancy, sorted and paginated in the database from the typed score
+        columns without reading candidate_data. Scans without a score are not ranked. `filters` may hold min_score, verdicts (a list),
+        scanned_after and scanned_before.
+        """
+        filters = filters or {}
+        statement = select(
+            ScanResult.id, ScanResult.resume_id, ScanResult.overall_score, ScanResult.verdict, ScanResult.scanned_at
+        ).where(ScanResult.vacancy_id == vacancy_id, ScanResult.overall_score.is_not(None))
+
+        if filters.get('min_score') is not None:
+            statement = statement.where(ScanResult.overall_score >= filters['min_score'])
+        if filters.get('verdicts'):
+            statement = statement.where(ScanResult.verdict.in_([verdict.lower() for verdict in filters['verdicts']]))
+        if filters.get('scanned_after') is not None:
+            statement = statement.where(ScanResult.scanned_at >= filters['scanned_after'])
+        if filters.get('scanned_before') is not None:
+            statement = statement.where(ScanResult.scanned_at < filters['scanned_before'])
+
+        # Unscored scans are left out so the order can be read backwards off ix_scan_results_vacancy_score
+        statement = statement.order_by(ScanResult.overall_score.desc(), ScanResult.id).offset(offset).limit(k)
+        return [ScoredCandidateDTO(*row) for row in self.session.execute(statement)]
@@ -0,0 +1,106 @@
+"""
+Brings an existing resume/vacancy database in line with the indexes declared on the models.
+
+    python resume_schema_migration.py upgrade --database-url postgresql://...
+    python resume_schema_migration.py downgrade --database-url postgresql://...
+
+upgrade() creates the foreign key indexes and the (vacancy_id, resume_id) unique index on
+scan_results (dropping duplicate scans first, newest kept), and drops the UNIQUE constraints that
+duplicated the string primary keys. It also adds the typed score columns of scan_results; fill them
+for existing rows with scan_score_backfill afterwards. downgrade() drops the indexes and the score
+columns again; the redundant constraints are not restored.
+"""
+import argparse
+import logging
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import DBAPIError
+from model1 import Certificate, Citizenship, Contact, Education, Experience, Language, Resume, Skill
+from model2 import Vacancy
+from model3 import ScanResult
+
+logger = logging.getLogger('resume_schema_migration')
+
+MODELS = (Vacancy, Resume, Education, Experience, Skill, Contact, Language, Citizenship, Certificate, ScanResult)
+
+SCAN_SCORE_COLUMNS = ('overall_score', 'verdict', 'scanned_at')
+
+DEDUPLICATE_SCAN_RESULTS = text(
+    'DELETE FROM scan_results WHERE id NOT IN ('
+    'SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM scan_results GROUP BY vacancy_id, resume_id) AS latest'
+    ')'
+)
+
+
+def _redundant_unique_constraints(inspector, model) -> list:
+    primary_key = [column.name for column in model.__table__.primary_key.columns]
+    return [
+        constraint['name'] for constraint in inspector.get_unique_constraints(model.__tablename__)
+        if constraint['name'] and constraint['column_names'] == primary_key
+    ]
+
+
+def _existing_columns(connection, table_name : str) -> set:
+    return {column['name'] for column in inspect(connection).get_columns(table_name)}
+
+
+def upgrade(engine):
+    with engine.begin() as connection:
+        existing_columns = _existing_columns(connection, ScanResult.__tablename__)
+        for name in SCAN_SCORE_COLUMNS:
+            if name not in existing_columns:
+                column_type = ScanResult.__table__.c[name].type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {ScanResult.__tablename__} ADD COLUMN {name} {column_type}'))
+
+        deleted = connection.execute(DEDUPLICATE_SCAN_RESULTS).rowcount
+        if deleted:
+            logger.info('Removed %s duplicate scan results', deleted)
+
+        for model in MODELS:
+            for index in model.__table__.indexes:
+                index.create(connection, checkfirst=True)
+
+        if connection.dialect.name == 'sqlite':
+            # SQLite cannot drop a constraint without rebuilding the table
+            logger.info('Keeping redundant UNIQUE constraints on SQLite')
+            return
+
+        inspector = inspect(connection)
+        for model in MODELS:
+            for name in _redundant_unique_constraints(inspector, model):
+                try:
+                    with connection.begin_nested():
+                        connection.execute(text(f'ALTER TABLE {model.__tablename__} DROP CONSTRAINT {name}'))
+                    logger.info('Dropped %s.%s', model.__tablename__, name)
+                except DBAPIError:
+                    # A foreign key may have been bound to this constraint instead of the primary key
+                    logger.warning('Keeping %s.%s, other objects depend on it', model.__tablename__, name)
+
+
+def downgrade(engine):
+    with engine.begin() as connection:
+        for model in MODELS:
+            for index in model.__table__.indexes:
+                index.drop(connection, checkfirst=True)
+
+        existing_columns = _existing_columns(connection, ScanResult.__tablename__)
+        for name in SCAN_SCORE_COLUMNS:
+            if name in existing_columns:
+                connection.execute(text(f'ALTER TABLE {ScanResult.__tablename__} DROP COLUMN {name}'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('direction', choices=['upgrade', 'downgrade'])
+    parser.add_argument('--database-url', required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    engine = create_engine(args.database_url)
+    if args.direction == 'upgrade':
+        upgrade(engine)
+    else:
+        downgrade(engine)
+
+
+if __name__ == '__main__':
+    main()
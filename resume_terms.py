@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from sqlalchemy import event
+from model1 import Education, Experience, Resume, Skill
+from model2 import Vacancy
+
+TOKEN_RE = re.compile(r'\w{2,}')
+TERMS_CACHE_MAX_ENTRIES = 50000
+# The cache is per process and the listeners below only see this process's ORM writes, so entries
+# changed by other workers or by Core writes such as the bulk importer are trusted at most this long
+TERMS_CACHE_TTL = 10 * 60
+
+
+def tokenize(text : str | None) -> list:
+    return TOKEN_RE.findall(text.casefold().replace('ё', 'е')) if text else []
+
+
+def resume_text_parts(resume) -> list:
+    """Fields of a resume (ORM object or scan-input DTO) that describe the candidate for ranking."""
+    parts = [resume.title]
+    parts.extend(skill if isinstance(skill, str) else skill.skill_name for skill in resume.skills)
+    for experience in resume.experience:
+        parts.extend((experience.position, experience.description))
+    for education in resume.education:
+        parts.extend((education.level, education.name, education.organization, education.result))
+    return parts
+
+
+def resume_terms(resume) -> Counter:
+    terms = Counter()
+    for part in resume_text_parts(resume):
+        terms.update(tokenize(part))
+    return terms
+
+
+class TermsCache:
+    """Term counts per key (resume_id or vacancy_id), LRU-bounded and expiring, shared across sessions of the process."""
+
+    def __init__(self, max_entries=TERMS_CACHE_MAX_ENTRIES, ttl=TERMS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys) -> dict:
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, terms = entry
+                if expires_at <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = terms
+        return found
+
+    def set(self, key, terms : Counter):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, terms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+resume_terms_cache = TermsCache()
+vacancy_terms_cache = TermsCache(max_entries=5000)
+
+
+@event.listens_for(Resume, 'after_insert')
+@event.listens_for(Resume, 'after_update')
+@event.listens_for(Resume, 'after_delete')
+@event.listens_for(Skill, 'after_insert')
+@event.listens_for(Skill, 'after_update')
+@event.listens_for(Skill, 'after_delete')
+@event.listens_for(Experience, 'after_insert')
+@event.listens_for(Experience, 'after_update')
+@event.listens_for(Experience, 'after_delete')
+@event.listens_for(Education, 'after_insert')
+@event.listens_for(Education, 'after_update')
+@event.listens_for(Education, 'after_delete')
+def invalidate_resume_terms(mapper, connection, target):
+    resume_terms_cache.discard(target.resume_id)
+
+
+@event.listens_for(Vacancy, 'after_update')
+@event.listens_for(Vacancy, 'after_delete')
+def invalidate_vacancy_terms(mapper, connection, target):
+    vacancy_terms_cache.discard(target.vacancy_id)
@@ -0,0 +1,69 @@
+"""
+Fills ScanResult.overall_score / verdict / scanned_at for rows written before the columns existed.
+
+    python scan_score_backfill.py --database-url postgresql://... --batch-size 1000
+
+Walks scan_results by id in batches, one transaction per batch, so it can be interrupted and
+rerun; rows that already have scanned_at are skipped.
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from sqlalchemy import bindparam, create_engine, select, update
+from model3 import ScanResult, extract_scan_scores
+
+logger = logging.getLogger('scan_score_backfill')
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def backfill_scan_scores(engine, batch_size : int = DEFAULT_BATCH_SIZE) -> int:
+    table = ScanResult.__table__
+    statement = update(table).where(table.c.id == bindparam('scan_id')).values(
+        # Bind names must differ from the column names in an executemany UPDATE
+        overall_score=bindparam('new_overall_score'),
+        verdict=bindparam('new_verdict'),
+        scanned_at=bindparam('new_scanned_at'),
+    )
+    last_id = 0
+    updated = 0
+    started = time.perf_counter()
+
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.candidate_data)
+                .where(table.c.id > last_id, table.c.scanned_at.is_(None))
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            params = []
+            for scan_id, candidate_data in rows:
+                scores = extract_scan_scores(candidate_data)
+                # The write time is unknown for old rows; the backfill time at least marks them as processed
+                scores['scanned_at'] = scores['scanned_at'] or datetime.now(timezone.utc).replace(tzinfo=None)
+                params.append({'scan_id': scan_id, **{f'new_{name}': value for name, value in scores.items()}})
+            connection.execute(statement, params)
+
+        last_id = rows[-1][0]
+        updated += len(rows)
+        logger.info('updated=%s last_id=%s rows/s=%.0f', updated, last_id, updated / (time.perf_counter() - started))
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    print(f'updated {backfill_scan_scores(create_engine(args.database_url), args.batch_size)} scan results')
+
+
+if __name__ == '__main__':
+    main()
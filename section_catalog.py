@@ -0,0 +1,176 @@
+import time
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from schoolproj import settings
+from training_test.models import Question, Test, TopicHandbook
+
+SECTION_CATALOG_TTL = getattr(settings, 'SECTION_CATALOG_TTL', 60 * 60 * 24)
+
+Topic = TopicHandbook._meta.get_field('topic').related_model
+Section = Topic._meta.get_field('section').related_model
+
+_MISSING = object()
+
+
+def section_content_version_key(section_id : int) -> str:
+    return f'section_{section_id}_content_version'
+
+
+def test_content_version_key(test_id : int) -> str:
+    return f'test_{test_id}_content_version'
+
+
+def _get_version(key : str) -> int:
+    version = cache.get(key)
+    if version is None:
+        # Time-based so a lost version never repeats one a client holds in an ETag
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key : str):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def get_section_content_version(section_id : int) -> int:
+    """Bumped when the section, its topics, tests or their questions change."""
+    return _get_version(section_content_version_key(section_id))
+
+
+def get_test_content_version(test_id : int) -> int:
+    """Bumped when the test or its questions (including their levels) change."""
+    return _get_version(test_content_version_key(test_id))
+
+
+def bump_section_content_version(section_ids):
+    for section_id in set(section_ids):
+        if section_id is not None:
+            _bump_version(section_content_version_key(section_id))
+
+
+def bump_test_content_version(test_ids):
+    test_ids = {test_id for test_id in test_ids if test_id is not None}
+    for test_id in test_ids:
+        _bump_version(test_content_version_key(test_id))
+    # The section catalog carries the question counts of its tests
+    bump_section_content_version(Test.objects.filter(id__in=test_ids).values_list('topic__section_id', flat=True))
+
+
+def section_catalog_key(section_id : int, level_id : int, version : int) -> str:
+    return f'section_{section_id}_level_{level_id}_catalog_v{version}'
+
+
+def build_section_catalog(section_id : int, level) -> dict | None:
+    question_prefetch = Prefetch(
+        'question',
+        queryset=Question.objects.filter(test_levels=level).order_by('id').distinct(),
+        to_attr='prefetched_questions'
+    )
+
+    test_prefetch = Prefetch(
+        'training_test',
+        queryset=Test.objects.filter(question__isnull=False, question__test_levels=level).prefetch_related(question_prefetch).order_by('id').distinct(),
+        to_attr='prefetched_tests'
+    )
+
+    topic_prefetch = Prefetch(
+        'topic',
+        queryset=Topic.objects.filter(
+            levels=level,
+            training_test__question__isnull=False,
+            training_test__question__test_levels=level
+        ).prefetch_related(test_prefetch).order_by('id').distinct(),
+        to_attr='prefetched_topics'
+    )
+
+    try:
+        section_instance = Section.objects.prefetch_related(topic_prefetch).get(id=section_id)
+    except Section.DoesNotExist:
+        return None
+
+    return {
+        'topics': [
+            {
+                'id': topic.id,
+                'name': topic.name,
+                'tests': [
+                    {'id': test.id, 'questions_count': len(test.prefetched_questions)}
+                    for test in topic.prefetched_tests
+                ],
+            }
+            for topic in section_instance.prefetched_topics
+        ],
+    }
+
+
+def get_section_catalog(section_id : int, level) -> dict | None:
+    """
+    Topics of the section for the level, each with its tests in order and their question counts.
+    The same for every student at the level, so it is built once per content version of the section.
+    None means the section does not exist.
+    """
+    key = section_catalog_key(section_id, level.id, get_section_content_version(section_id))
+    catalog = cache.get(key, _MISSING)
+    if catalog is _MISSING:
+        catalog = build_section_catalog(section_id, level)
+        cache.set(key, catalog, timeout=SECTION_CATALOG_TTL)
+    return catalog
+
+
+@receiver([post_save, post_delete], sender=Section)
+def invalidate_section(sender, instance, **kwargs):
+    bump_section_content_version([instance.id])
+
+
+@receiver([post_save, post_delete], sender=Topic)
+def invalidate_topic(sender, instance, **kwargs):
+    bump_section_content_version([instance.section_id])
+
+
+@receiver([post_save, post_delete], sender=Test)
+def invalidate_test(sender, instance, **kwargs):
+    _bump_version(test_content_version_key(instance.id))
+    # Looked up through the topic: after a delete the test row itself is gone
+    bump_section_content_version(Topic.objects.filter(id=instance.topic_id).values_list('section_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_question(sender, instance, **kwargs):
+    bump_test_content_version([instance.test_id])
+
+
+@receiver(m2m_changed, sender=Question.test_levels.through)
+def invalidate_question_levels(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_test_content_version([instance.test_id])
+        return
+    # Changed from the level side: pk_set holds question ids, and a clear has to be resolved before it runs
+    if action in ('post_add', 'post_remove'):
+        questions = Question.objects.filter(id__in=pk_set)
+    elif action == 'pre_clear':
+        questions = Question.objects.filter(test_levels=instance)
+    else:
+        return
+    bump_test_content_version(questions.values_list('test_id', flat=True).distinct())
+
+
+@receiver(m2m_changed, sender=Topic.levels.through)
+def invalidate_topic_levels(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_section_content_version([instance.section_id])
+        return
+    if action in ('post_add', 'post_remove'):
+        topics = Topic.objects.filter(id__in=pk_set)
+    elif action == 'pre_clear':
+        topics = Topic.objects.filter(levels=instance)
+    else:
+        return
+    bump_section_content_version(topics.values_list('section_id', flat=True).distinct())
@@ -0,0 +1,56 @@
+from celery.signals import task_postrun
+from django.core.cache import cache
+from schoolproj import settings
+
+# Upper bound for a lock whose task never reported back (worker killed, message lost)
+SINGLE_FLIGHT_TTL = getattr(settings, 'SINGLE_FLIGHT_TTL', 60 * 10)
+
+SINGLE_FLIGHT_HEADER = 'single_flight_key'
+
+
+def single_flight_key(task_name : str, key) -> str:
+    return f'single_flight_{task_name}_{key}'
+
+
+def suppressed_counter_key(task_name : str) -> str:
+    return f'single_flight_{task_name}_suppressed'
+
+
+def incr_counter(key : str):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_suppressed_count(task) -> int:
+    return cache.get(suppressed_counter_key(task.name), 0)
+
+
+def enqueue_once(task, *args, key=None, ttl=None) -> bool:
+    """
+    task.delay(*args) unless the same task for the same key is already queued or running.
+    `key` defaults to the first argument. Returns False when the call was suppressed as a duplicate.
+    """
+    lock_key = single_flight_key(task.name, args[0] if key is None else key)
+    if not cache.add(lock_key, 1, timeout=ttl or SINGLE_FLIGHT_TTL):
+        incr_counter(suppressed_counter_key(task.name))
+        return False
+
+    try:
+        task.apply_async(args=args, headers={SINGLE_FLIGHT_HEADER: lock_key})
+    except Exception:
+        cache.delete(lock_key)
+        raise
+    return True
+
+
+@task_postrun.connect
+def release_single_flight(task=None, **kwargs):
+    request = getattr(task, 'request', None)
+    if request is None:
+        return
+    lock_key = getattr(request, SINGLE_FLIGHT_HEADER, None) or (getattr(request, 'headers', None) or {}).get(SINGLE_FLIGHT_HEADER)
+    if lock_key:
+        cache.delete(lock_key)
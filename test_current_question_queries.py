@@ -0,0 +1,178 @@
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from training_test.models import Difficulty, Question, QuestionAndStudentRecord, QuestionClone, SubjectLevel, Test
+from training_test.views.test import test_questions as current_question_views
+from training_test.views.test.test_questions import build_current_question
+
+Topic = Test._meta.get_field('topic').related_model
+Section = Topic._meta.get_field('section').related_model
+Subject = Section._meta.get_field('subject').related_model
+Quarter = SubjectLevel._meta.get_field('quarter').related_model
+Student = SubjectLevel._meta.get_field('student').related_model
+QuestionPayload = Question._meta.get_field('payload').related_model
+QuestionClonePayload = QuestionClone._meta.get_field('payload').related_model
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CurrentQuestionTestCase(TestCase):
+    """
+    One test of three single-choice questions with one pooled clone of the first, and a student per branch:
+    nothing answered, first question answered right, first question answered wrong, everything answered.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        subject = Subject.objects.create(name='Қазақ тілі')
+        section = Section.objects.create(subject=subject, name='Морфология')
+        topic = Topic.objects.create(section=section, name='Зат есім')
+        cls.test = Test.objects.create(topic=topic)
+        cls.level = Difficulty.objects.create(name='A')
+        cls.quarter = Quarter.objects.create(number=1)
+
+        cls.questions = []
+        for number in range(1, 4):
+            question = Question.objects.create(
+                test=cls.test, difficulty=cls.level, question_type='single_choice',
+                payload=QuestionPayload.objects.create(text=f'Вопрос {number}', criteria='Ответ 10'),
+            )
+            question.test_levels.add(cls.level)
+            cls.questions.append(question)
+        cls.clone = QuestionClone.objects.create(
+            question=cls.questions[0], difficulty=cls.level, question_type='single_choice',
+            payload=QuestionClonePayload.objects.create(text='Вопрос 1, вариант 2', criteria='Ответ 10'),
+        )
+
+        cls.students = {}
+        for name in ('warmup', 'fresh', 'proceed', 'clone', 'finished'):
+            student = Student.objects.create(username=f'student_{name}')
+            SubjectLevel.objects.create(student=student, subject=subject, quarter=cls.quarter, level=cls.level)
+            cls.students[name] = student
+
+        cls.answer(cls.students['proceed'], cls.questions[0], allowed_to_proceed=True)
+        cls.answer(cls.students['clone'], cls.questions[0], allowed_to_proceed=False)
+        for question in cls.questions:
+            cls.answer(cls.students['finished'], question, allowed_to_proceed=True)
+
+    @classmethod
+    def answer(cls, student, question, allowed_to_proceed):
+        return QuestionAndStudentRecord.objects.create(
+            student=student, question=question, question_clone=None,
+            allowed_to_proceed=allowed_to_proceed, student_response='A',
+        )
+
+    def setUp(self):
+        cache.clear()
+        patchers = [
+            mock.patch('training_test.views.test.level_resolver.get_current_quarter', return_value=self.quarter),
+            # Background clone generation is out of scope
+            mock.patch('training_test.views.test.test_questions.enqueue_once'),
+            mock.patch('training_test.views.test.clone_pool.enqueue_once'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Quarter, test subject, question ids and the clone flag are shared by all students of the test
+        build_current_question(self.test.id, self.students['warmup'].id)
+
+
+class BuildCurrentQuestionQueriesTests(CurrentQuestionTestCase):
+    """
+    Exact query count of every build_current_question branch: a student's first request costs
+    their level, their records and the served row; with their caches warm only the served row is left.
+    """
+
+    def assert_queries(self, student_name, is_clone=False):
+        student_id = self.students[student_name].id
+        with CaptureQueriesContext(connection) as first_request:
+            response = build_current_question(self.test.id, student_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data['is_clone'], is_clone)
+        self.assertEqual(len(first_request), 3, first_request.captured_queries)
+
+        with CaptureQueriesContext(connection) as warm_request:
+            build_current_question(self.test.id, student_id)
+        self.assertEqual(len(warm_request), 1, warm_request.captured_queries)
+        return response
+
+    def test_fresh_start(self):
+        response = self.assert_queries('fresh')
+        self.assertEqual(response.data['order'], 1)
+
+    def test_proceed(self):
+        response = self.assert_queries('proceed')
+        self.assertEqual(response.data['order'], 2)
+
+    def test_clone(self):
+        response = self.assert_queries('clone', is_clone=True)
+        self.assertEqual(response.data['order'], 1)
+
+    def test_finished(self):
+        response = self.assert_queries('finished')
+        self.assertEqual(response.data['order'], len(self.questions))
+        self.assertEqual(response.data['student_response'], 'A')
+
+
+class TestQuestionsCacheTests(CurrentQuestionTestCase):
+    """The payload cache, lock and ETag layer of test_questions on top of build_current_question."""
+
+    def test_cached_payload_and_not_modified(self):
+        student_id = self.students['fresh'].id
+        first = current_question_views.test_questions(self.test.id, student_id)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        etag = first['ETag']
+
+        with CaptureQueriesContext(connection) as cached_request:
+            second = current_question_views.test_questions(self.test.id, student_id)
+        self.assertEqual(len(cached_request), 0, cached_request.captured_queries)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], etag)
+
+        with CaptureQueriesContext(connection) as conditional_request:
+            not_modified = current_question_views.test_questions(self.test.id, student_id, if_none_match=etag)
+        self.assertEqual(len(conditional_request), 0, conditional_request.captured_queries)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_answer_changes_etag(self):
+        student_id = self.students['fresh'].id
+        first = current_question_views.test_questions(self.test.id, student_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.answer(self.students['fresh'], Question.objects.get(id=first.data['id']), allowed_to_proceed=True)
+
+        second = current_question_views.test_questions(self.test.id, student_id, if_none_match=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['order'], 2)
+
+    def test_question_edit_changes_etag(self):
+        student_id = self.students['fresh'].id
+        first = current_question_views.test_questions(self.test.id, student_id)
+
+        Question.objects.get(id=first.data['id']).save()
+
+        second = current_question_views.test_questions(self.test.id, student_id, if_none_match=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_builder_rechecks_cache_after_taking_lock(self):
+        student_id = self.students['fresh'].id
+        first = current_question_views.test_questions(self.test.id, student_id)
+
+        # A request that missed the payload just before it was cached, and only gets the lock now
+        misses = [True]
+
+        def get(key, *args, **kwargs):
+            return None if misses and misses.pop() else cache.get(key, *args, **kwargs)
+
+        late_cache = mock.Mock(wraps=cache, get=mock.Mock(side_effect=get))
+        with mock.patch('training_test.views.test.test_questions.cache', late_cache), \
+                mock.patch('training_test.views.test.test_questions.build_current_question') as build:
+            second = current_question_views.test_questions(self.test.id, student_id)
+        build.assert_not_called()
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
@@ -0,0 +1,150 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from schoolproj import settings
+from training_test.models import Question, QuestionAndStudentRecord
+from training_test.views.test.section_catalog import get_test_content_version
+
+TEST_PROGRESS_TTL = getattr(settings, 'TEST_PROGRESS_TTL', 60 * 60 * 24)
+CURRENT_QUESTION_TTL = getattr(settings, 'CURRENT_QUESTION_TTL', 60 * 10)
+CURRENT_QUESTION_LOCK_TTL = getattr(settings, 'CURRENT_QUESTION_LOCK_TTL', 10)
+
+
+def test_progress_key(student_id : int, test_id : int) -> str:
+    return f'student_{student_id}_test_{test_id}_progress'
+
+
+def _record_state(record) -> dict:
+    return {
+        'id': record['id'],
+        'question_id': record['question_id'],
+        'question_clone_id': record['question_clone_id'],
+        'allowed_to_proceed': record['allowed_to_proceed'],
+    }
+
+
+def apply_record(progress : dict, record : dict) -> bool:
+    """Folds one QuestionAndStudentRecord (as a values() dict) into the progress state."""
+    if record['question_id'] not in progress['question_id_set']:
+        return False
+
+    progress['answered_ids'].add(record['question_id'])
+    if record['question_clone_id']:
+        progress['used_clone_ids'].add(record['question_clone_id'])
+    progress['distinct_count'] = len(progress['answered_ids'])
+
+    last_record = progress['last_record']
+    if last_record is None or record['id'] >= last_record['id']:
+        progress['last_record'] = _record_state(record)
+    progress['allowed_to_proceed'] = progress['last_record']['allowed_to_proceed']
+    return True
+
+
+def test_question_ids_key(test_id : int, level_id : int, content_version : int) -> str:
+    return f'test_{test_id}_level_{level_id}_question_ids_v{content_version}'
+
+
+def get_test_question_ids(test_id : int, level, content_version : int) -> list:
+    """Ordered question ids of the test for the level, shared by all students until the content changes."""
+    key = test_question_ids_key(test_id, level.id, content_version)
+    question_ids = cache.get(key)
+    if question_ids is None:
+        question_ids = list(
+            Question.objects.filter(test_id=test_id, test_levels=level).order_by('id').values_list('id', flat=True)
+        )
+        cache.set(key, question_ids, timeout=TEST_PROGRESS_TTL)
+    return question_ids
+
+
+def build_test_progress(test_id : int, student_id : int, level, content_version : int) -> dict:
+    question_ids = get_test_question_ids(test_id, level, content_version)
+    progress = {
+        'level_id': level.id,
+        'content_version': content_version,
+        'question_ids': question_ids,
+        'question_id_set': set(question_ids),
+        'answered_ids': set(),
+        'used_clone_ids': set(),
+        'distinct_count': 0,
+        'last_record': None,
+        'allowed_to_proceed': True,
+    }
+
+    records = QuestionAndStudentRecord.objects.filter(
+        question_id__in=question_ids, student_id=student_id
+    ).order_by('id').values('id', 'question_id', 'question_clone_id', 'allowed_to_proceed')
+    for record in records:
+        apply_record(progress, record)
+    return progress
+
+
+def get_test_progress(test_id : int, student_id : int, level) -> dict:
+    """
+    Per (student, test) progress: ordered question ids for the level, answered question ids,
+    clones already served, distinct answered count and the last record.
+    Dropped by the record signals below once their transaction commits, and rebuilt whenever the level or
+    the content version of the test (bumped by section_catalog on question and test_levels changes) differs.
+    """
+    key = test_progress_key(student_id, test_id)
+    content_version = get_test_content_version(test_id)
+    progress = cache.get(key)
+    if progress is None or progress['level_id'] != level.id or progress.get('content_version') != content_version:
+        progress = build_test_progress(test_id, student_id, level, content_version)
+        cache.set(key, progress, timeout=TEST_PROGRESS_TTL)
+    return progress
+
+
+def current_question_version_key(student_id : int, test_id : int) -> str:
+    return f'student_{student_id}_test_{test_id}_current_question_version'
+
+
+def current_question_key(student_id : int, test_id : int, version : int, content_version : int) -> str:
+    return f'student_{student_id}_test_{test_id}_current_question_v{version}_c{content_version}'
+
+
+def current_question_lock_key(student_id : int, test_id : int) -> str:
+    return f'student_{student_id}_test_{test_id}_current_question_lock'
+
+
+def _initial_version() -> int:
+    # Time-based so a version key lost to eviction never restarts at a number an old payload still uses
+    return int(time.time() * 1000)
+
+
+def get_current_question_version(student_id : int, test_id : int) -> int:
+    key = current_question_version_key(student_id, test_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_current_question_version(student_id : int, test_id : int) -> int:
+    key = current_question_version_key(student_id, test_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+        return cache.get(key)
+
+
+def get_remaining_question_ids(progress : dict) -> list:
+    answered_ids = progress['answered_ids']
+    return [question_id for question_id in progress['question_ids'] if question_id not in answered_ids]
+
+
+def drop_test_progress(student_id : int, test_id : int):
+    cache.delete(test_progress_key(student_id, test_id))
+    bump_current_question_version(student_id, test_id)
+
+
+@receiver([post_save, post_delete], sender=QuestionAndStudentRecord)
+def invalidate_test_progress(sender, instance, **kwargs):
+    # Dropped rather than patched: concurrent submits would race on a read-modify-write of the cached state,
+    # and waiting for the commit keeps a rolled back record out of it
+    test_id = Question.objects.filter(id=instance.question_id).values_list('test_id', flat=True).first()
+    if test_id is not None:
+        transaction.on_commit(lambda: drop_test_progress(instance.student_id, test_id))
@@ -1,14 +1,21 @@
 import random
+import time
 from django.core.cache import cache
-from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from rest_framework import status
 from rest_framework.response import Response
-from handbook.utils.current_quarter import get_current_quarter
-from training_test.models import QuestionAndStudentRecord, Test, Question, QuestionClone, SubjectLevel, Difficulty
+from training_test.models import QuestionAndStudentRecord, Question, Difficulty
 from training_test.serializers import StudentQuestionPayloadGetSerializer
-from training_test.tasks.generate_clones import process_questions_in_background, task_generate_gpt_extra_questions
+from training_test.tasks.generate_clones import process_questions_in_background
 from training_test.views.question_clone.gpt_question import generate_gpt_question
-from utils.translate import translate_text
+from training_test.views.test.clone_pool import take_clone, test_has_clones
+from training_test.views.test.etags import etag_matches, make_etag, not_modified, with_etag
+from training_test.views.test.level_resolver import resolve_level
+from training_test.views.test.section_catalog import get_test_content_version
+from training_test.views.test.single_flight import enqueue_once
+from training_test.views.test.test_progress import (
+    CURRENT_QUESTION_LOCK_TTL, CURRENT_QUESTION_TTL, bump_current_question_version, current_question_key,
+    current_question_lock_key, get_current_question_version, get_remaining_question_ids, get_test_progress,
+)
 
 
 def get_empty_student_response(next_question_type):
@@ -24,77 +31,138 @@ def get_empty_student_response(next_question_type):
 
 
 def get_student_level_by_test_id(test_id : int, student_id : int) -> Difficulty | Response | None:
-    quarter = get_current_quarter()
-    if not quarter:
-        return Response({"detail": "Нет текущей четверти или каникулы"}, status=status.HTTP_404_NOT_FOUND)
+    return resolve_level(test_id, student_id)
+
+
+CURRENT_QUESTION_WAIT = 2
+CURRENT_QUESTION_WAIT_STEP = 0.05
+
+
+def current_question_etag(student_id : int, test_id : int, version : int, content_version : int) -> str:
+    return make_etag('question', student_id, test_id, version, content_version)
+
+
+def read_current_question(student_id : int, test_id : int) -> tuple[int, int, dict | None]:
+    """Current (version, content version of the test, cached payload or None) of the student's question."""
+    version = get_current_question_version(student_id, test_id)
+    content_version = get_test_content_version(test_id)
+    return version, content_version, cache.get(current_question_key(student_id, test_id, version, content_version))
+
+
+def test_questions(test_id : int, student_id : int, if_none_match : str | None = None) -> Response:
+    """
+    Read-through cache for the current question. The payload is stored under the student's
+    current version for the test, which the record signals bump on every answer and each rebuild bumps
+    again, and under the content version of the test, which question edits, deletes and level changes bump.
+    So a cached question is never served after it was answered or changed, and an ETag never outlives its
+    payload. Only one request builds the payload at a time; concurrent ones wait for it instead of picking a different random question.
+    `if_none_match` is the request's If-None-Match header; a client that already holds the payload
+    of the current version gets 304 after two cache reads.
+    """
+    version = get_current_question_version(student_id, test_id)
+    content_version = get_test_content_version(test_id)
+    etag = current_question_etag(student_id, test_id, version, content_version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    cached_data = cache.get(current_question_key(student_id, test_id, version, content_version))
+    if cached_data:
+        return with_etag(Response(cached_data, status=status.HTTP_200_OK), etag)
+
+    lock_key = current_question_lock_key(student_id, test_id)
+    if not cache.add(lock_key, version, timeout=CURRENT_QUESTION_LOCK_TTL):
+        deadline = time.monotonic() + CURRENT_QUESTION_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(CURRENT_QUESTION_WAIT_STEP)
+            # The builder caches the payload under the version it bumped to
+            version, content_version, cached_data = read_current_question(student_id, test_id)
+            if cached_data:
+                return with_etag(
+                    Response(cached_data, status=status.HTTP_200_OK),
+                    current_question_etag(student_id, test_id, version, content_version)
+                )
+        # The builder is stuck or died, answer without touching the cache (and without an ETag)
+        return build_current_question(test_id, student_id)
 
     try:
-        test_instance = Test.objects.select_related('topic__section__subject').get(id=test_id)
-        subject = test_instance.topic.section.subject
-    except (ObjectDoesNotExist, MultipleObjectsReturned, Exception) as e:
-        return Response({'detail': translate_text(str(e))}, status=status.HTTP_404_NOT_FOUND)
-
-    subject_level = SubjectLevel.objects.filter(student_id=student_id, quarter=quarter, subject=subject)
-    if subject_level.exists():
-        level = subject_level.first().level
-    else:
-        level = None
-
-    return level
-
-def test_questions(test_id : int, student_id : int) -> Response:
-
-    cache_key = f'student_{student_id}_test_{test_id}_current_question'
-
-    cached_data = cache.get(cache_key)
-    # if cached_data:
-    #     return Response(cached_data, status=status.HTTP_200_OK)
+        # Another request may have built and released the lock between our miss and cache.add
+        version, content_version, cached_data = read_current_question(student_id, test_id)
+        if cached_data:
+            return with_etag(
+                Response(cached_data, status=status.HTTP_200_OK),
+                current_question_etag(student_id, test_id, version, content_version)
+            )
 
+        response = build_current_question(test_id, student_id)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+
+        # Every rebuild may pick a different random question or clone, so it gets a version (and an ETag)
+        # of its own; a client still holding the ETag of an expired payload must not get 304 for the new one
+        new_version = bump_current_question_version(student_id, test_id)
+        if new_version != version + 1 or get_test_content_version(test_id) != content_version:
+            # A record was written or the test changed while building, the payload may already be outdated
+            return response
+        version = new_version
+        cache.set(
+            current_question_key(student_id, test_id, version, content_version), response.data,
+            timeout=CURRENT_QUESTION_TTL
+        )
+        return with_etag(response, current_question_etag(student_id, test_id, version, content_version))
+    finally:
+        cache.delete(lock_key)
+
+
+def build_current_question(test_id : int, student_id : int) -> Response:
+    """
+    With warm caches (level, progress, clone flag) every branch costs one query: the next question,
+    the pooled clone or the last record, each with its payload. A student's first request adds the level
+    and their records; the quarter, test subject, question ids and clone flag are shared by all students
+    and only cost a query each for the first student after the content changes.
+    """
     level = get_student_level_by_test_id(test_id, student_id)
+    if isinstance(level, Response):
+        return level
     if not level:
         return Response({"detail": "Уровень ученика на предмет и четверть не найден"}, status=status.HTTP_404_NOT_FOUND)
 
-    questions_queryset = Question.objects.filter(test_id=test_id, test_levels=level).order_by('id')
-
-    test_instance_questions = list(questions_queryset)
-    recorded_questions_queryset = QuestionAndStudentRecord.objects.filter(question__in=questions_queryset, student_id=student_id)
-    recorded_questions = list(recorded_questions_queryset)
+    progress = get_test_progress(test_id, student_id, level)
+    question_ids = progress['question_ids']
 
-    if not QuestionClone.objects.filter(question__test__id=test_id, question__test_levels=level).exists():
-        print('process_questions_in_background')
-        process_questions_in_background.delay(test_id)
+    if not test_has_clones(test_id, level):
+        enqueue_once(process_questions_in_background, test_id)
 
-    recorded_questions_list = [recorded_question.question for recorded_question in recorded_questions]
-    distinct_questions_count = len(set(recorded_questions_list))
-    last_question_record = recorded_questions[-1] if recorded_questions else None
+    distinct_questions_count = progress['distinct_count']
+    last_record = progress['last_record']
 
-    if last_question_record:
-        last_id = last_question_record.question_id
-        allowed_to_proceed = last_question_record.allowed_to_proceed
+    if last_record:
+        last_id = last_record['question_id']
+        allowed_to_proceed = last_record['allowed_to_proceed']
     else:
         # If no questions have been attempted, start with the first question
-        first_question = test_instance_questions[0] if test_instance_questions else []
-        last_id = first_question.id if first_question else None
+        last_id = question_ids[0] if question_ids else None
         allowed_to_proceed = True
 
     if allowed_to_proceed:
         is_clone = False
         next_question = None
         # Proceed to the next random question if the last one was answered correctly
-        remaining_questions = [q for q in test_instance_questions if
-                               q.id not in [rq.question_id for rq in recorded_questions]]
+        remaining_question_ids = get_remaining_question_ids(progress)
 
-        if remaining_questions:
+        if remaining_question_ids:
             order = distinct_questions_count + 1
-            next_question = random.choice(remaining_questions)
+            next_question = Question.objects.select_related('payload').get(id=random.choice(remaining_question_ids))
             student_response = get_empty_student_response(next_question.question_type)
             if isinstance(student_response, Response):
                 return student_response
 
         else:
             order = distinct_questions_count
-            questions_count = len(test_instance_questions)
-            if order >= questions_count and last_question_record:
+            questions_count = len(question_ids)
+            if order >= questions_count and last_record:
+                last_question_record = QuestionAndStudentRecord.objects.select_related(
+                    'question__payload', 'question_clone__payload'
+                ).get(id=last_record['id'])
                 last_question = last_question_record.question_clone
                 if not last_question:
                     last_question = last_question_record.question
@@ -113,31 +181,16 @@ def test_questions(test_id : int, student_id : int) -> Response:
         response['is_clone'] = is_clone
         response['student_response'] = student_response
 
-
-        cache.set(cache_key, response, timeout=None)
-
         return Response(response)
 
     else:
         is_clone = True
         order = distinct_questions_count
-        # If not allowed to proceed, get or generate a clone question
-        if last_id:
-            clone_questions = QuestionClone.objects.filter(question_id=last_id).exclude(
-                id__in=[rq.question_clone_id for rq in recorded_questions if rq.question_clone_id]
-            )
-        else:
-            clone_questions = QuestionClone.objects.none()
+        # If not allowed to proceed, serve a clone from the pool
+        next_question = take_clone(last_id, progress['used_clone_ids']) if last_id else None
 
-        if clone_questions.exists():
-            next_question = random.choice(clone_questions)
-            if clone_questions.count() == 1 and last_id:
-                task_generate_gpt_extra_questions.delay(last_id, 3)
-        else:
-            # If no clone exists, generate one using GPT
-            print('clones didnt exist')
-            if last_id:
-                task_generate_gpt_extra_questions.delay(last_id, 3)
+        if next_question is None:
+            # The pool is empty and is being refilled in the background, generate one using GPT meanwhile
             next_question = generate_gpt_question(last_id) if last_id else None
 
             if isinstance(next_question, Response):
@@ -159,8 +212,6 @@ def test_questions(test_id : int, student_id : int) -> Response:
 
             response['student_response'] = student_response
 
-            cache.set(cache_key, response, timeout=None)
-
             return Response(response, status=status.HTTP_200_OK)
         else:
             return Response({"detail": "Не удалось сгенерировать вопрос."},
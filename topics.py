@@ -1,96 +1,87 @@
-question_prefetch = Prefetch(
-        'question',
-        queryset=Question.objects.filter(test_levels=level).order_by('id').distinct(),
-        to_attr='prefetched_questions'
+# Cheap stamp of everything the response depends on, checked before any query runs
+    topics_etag = make_etag(
+        'topics', section_id, level.id, student_id, get_section_content_version(section_id),
+        get_topic_stats_version(student_id),
     )
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), topics_etag):
+        return not_modified(topics_etag)
 
-    test_prefetch = Prefetch(
-        'training_test',
-        queryset=Test.objects.filter(question__isnull=False, question__test_levels=level).prefetch_related(question_prefetch).order_by('id').distinct(),
-        to_attr='prefetched_tests'
-    )
-
-    topic_prefetch = Prefetch(
-        'topic',
-        queryset=Topic.objects.filter(
-            levels=level,
-            training_test__question__isnull=False,
-            training_test__question__test_levels=level
-        ).prefetch_related(test_prefetch).order_by('id').distinct(),
-        to_attr='prefetched_topics'
-    )
-
-    try:
-        section_instance = Section.objects.prefetch_related(topic_prefetch).get(id=section_id)
-    except Section.DoesNotExist:
+    catalog = get_section_catalog(section_id, level)
+    if catalog is None:
         return Response({"detail": "Заголовок не найден"}, status=status.HTTP_404_NOT_FOUND)
 
-    topics = section_instance.prefetched_topics
+    topics = catalog['topics']
 
     if not topics:
         return Response({"detail": "Темы не найдены"}, status=status.HTTP_404_NOT_FOUND)
 
     # Fetch the student's TopicTrainingStat for all topics in this section
-    topic_ids = [topic.id for topic in topics]
-    topic_stats = TopicTrainingStat.objects.filter(student_id=student_id, topic_id__in=topic_ids, level=level)
+    topic_ids = [topic['id'] for topic in topics]
+    # Newest first, so the oldest row wins the lookup below if a race ever stored duplicates
+    topic_stats = TopicTrainingStat.objects.filter(
+        student_id=student_id, topic_id__in=topic_ids, level=level
+    ).order_by('-id')
 
     # Create a lookup dictionary for fast access to topic stats
     topic_stats_dict = {stat.topic_id: stat for stat in topic_stats}
 
-    responses = []
+    # First visit: create the missing stats in one INSERT, with the current test already filled in
+    missing_stats = []
     for topic in topics:
-        topic_name = topic.name
-
-        # Get the prefetched tests
-        tests = topic.prefetched_tests
-
-        # Get the topic status from TopicTrainingStat or default to 'not_available'
-        if topic.id in topic_stats_dict:
-            topic_stat = topic_stats_dict[topic.id]
+        if topic['id'] in topic_stats_dict:
+            continue
+        current_test = topic['tests'][0] if topic['tests'] else None
+        missing_stats.append(TopicTrainingStat(
+            student_id=student_id, topic_id=topic['id'], level=level, finished_tests_count=0, tests_count=0,
+            current_test_id=current_test['id'] if current_test else None,
+            current_test_questions_count=current_test['questions_count'] if current_test else 0,
+        ))
+
+    if missing_stats:
+        # ignore_conflicts only dedupes against a unique (student, topic, level) constraint on
+        # TopicTrainingStat; without it two tabs racing here both insert. It also leaves pks unset,
+        # so read back what is actually stored, picking the oldest row per topic
+        TopicTrainingStat.objects.bulk_create(missing_stats, ignore_conflicts=True)
+        created_stats = TopicTrainingStat.objects.filter(
+            student_id=student_id, topic_id__in=[stat.topic_id for stat in missing_stats], level=level
+        ).order_by('-id')
+        topic_stats_dict.update({stat.topic_id: stat for stat in created_stats})
 
-            # #tests_count = topic_stat.get_tests_count()
-            # tests_count = len(tests)
-            # #tests_finished = topic_stat.get_finished_tests_count()
-            # tests_finished = topic_stat.finished_tests_count
-            # topic_status = topic_stat.get_status(tests_count=tests_count, finished_tests_count=tests_finished)
-            #
-            # if topic_status == ETestStatus.NOT_AVAILABLE:
-            #     topic_status = ETestStatus.IN_PROGRESS
-            #
-            # if tests_finished == tests_count:
-            #     test_index = tests_finished - 1
-            # else:
-            #     test_index = tests_finished
-            # current_test = tests[test_index] if tests and tests_count > test_index else None
-            # current_test_id = current_test.id if current_test else None
-            #
-            #
-            # prefetched_questions = current_test.prefetched_questions if current_test else []
-            # questions_count = len(prefetched_questions) if prefetched_questions else 0
-
-
-        else:
-            # topic_status = ETestStatus.NOT_AVAILABLE
-            topic_stat = TopicTrainingStat.objects.create(student_id=student_id, topic_id=topic.id, level=level,
-                                                          finished_tests_count=0, tests_count=0)
-
-            # tests_count = len(tests)
-            # topic_status = ETestStatus.IN_PROGRESS
-            # tests_finished = topic_stat.get_finished_tests_count()
-            # if topics.index(topic) == 0:
-            #     topic_status = ETestStatus.IN_PROGRESS
-            #
-            # current_test = tests[0] if len(tests) > 0 else None
-            # current_test_id = current_test.id if tests else None
-            # prefetched_questions = current_test.prefetched_questions if current_test else []
-            # questions_count = len(prefetched_questions) if prefetched_questions else 0
+    responses = []
+    for topic in topics:
+        topic_name = topic['name']
+
+        # Tests of the topic from the catalog, with their question counts
+        tests = topic['tests']
+
+        topic_stat = topic_stats_dict[topic['id']]
+
+        # #tests_count = topic_stat.get_tests_count()
+        # tests_count = len(tests)
+        # #tests_finished = topic_stat.get_finished_tests_count()
+        # tests_finished = topic_stat.finished_tests_count
+        # topic_status = topic_stat.get_status(tests_count=tests_count, finished_tests_count=tests_finished)
+        #
+        # if topic_status == ETestStatus.NOT_AVAILABLE:
+        #     topic_status = ETestStatus.IN_PROGRESS
+        #
+        # if tests_finished == tests_count:
+        #     test_index = tests_finished - 1
+        # else:
+        #     test_index = tests_finished
+        # current_test = tests[test_index] if tests and tests_count > test_index else None
+        # current_test_id = current_test.id if current_test else None
+        #
+        #
+        # prefetched_questions = current_test.prefetched_questions if current_test else []
+        # questions_count = len(prefetched_questions) if prefetched_questions else 0
 
         questions_count = topic_stat.current_test_questions_count
         current_test_id = topic_stat.current_test_id
 
         if questions_count != 0 and current_test_id is not None:
             response = {
-                "id": topic.id,
+                "id": topic['id'],
                 "name": topic_name,
                 "status": topic_stat.status,
                 "tests_count": questions_count,
@@ -99,3 +90,5 @@ question_prefetch = Prefetch(
                 "questions_count": questions_count,
             }
             responses.append(response)
+
+    return with_etag(Response(responses, status=status.HTTP_200_OK), topics_etag)